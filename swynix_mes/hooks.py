@@ -146,6 +146,14 @@ after_migrate = "swynix_mes.setup.install.after_migrate"
 # 	}
 # }
 
+doc_events = {
+	"Workstation": {
+		"on_update": "swynix_mes.swynix_mes.utils.workstation_cache.clear_workstation_cache",
+		"on_trash": "swynix_mes.swynix_mes.utils.workstation_cache.clear_workstation_cache",
+		"after_rename": "swynix_mes.swynix_mes.utils.workstation_cache.clear_workstation_cache",
+	}
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -18,6 +18,7 @@ import frappe
 from frappe import _
 from frappe.utils import getdate, now_datetime, flt, nowdate
 from swynix_mes.swynix_mes.utils.coil_logging import log_coil_event
+from swynix_mes.swynix_mes.utils.workstation_cache import get_workstations
 
 
 # ==================== HELPERS ====================
@@ -92,12 +93,7 @@ def get_casters():
     PPC Caster Kiosk and PPC Casting Plan form, all filtering by
     Workstation type.
     """
-    return frappe.get_all(
-        "Workstation",
-        filters={"workstation_type": "Casting"},
-        fields=["name", "workstation_name"],
-        order_by="name asc"
-    )
+    return get_workstations("Casting")
 
 
 @frappe.whitelist()
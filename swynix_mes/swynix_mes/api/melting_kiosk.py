@@ -3,13 +3,133 @@
 
 import frappe
 from frappe import _
-from frappe.utils import getdate, now_datetime, get_datetime, flt
+from frappe.utils import cint, getdate, now_datetime, get_datetime, flt
+from frappe.utils.caching import request_cache
+from swynix_mes.swynix_mes.utils.workstation_cache import get_workstations
+from swynix_mes.swynix_mes.doctype.melting_batch.melting_batch import (
+    FURNACE_AVAILABILITY_CACHE_TTL,
+    FURNACE_BATCHES_CACHE_TTL,
+    get_furnace_availability_cache_key,
+    get_furnace_batches_cache_key,
+)
+from collections import defaultdict
 from datetime import timedelta
+from functools import lru_cache
+import hashlib
+from types import MappingProxyType
 
 # Active statuses that indicate a batch is occupying the furnace
 ACTIVE_BATCH_STATUSES = [
     "Charging", "Melting", "Fluxing", "Sampling", "Correction", "Ready for Transfer"
 ]
+_ACTIVE_STATUSES_TUPLE = tuple(ACTIVE_BATCH_STATUSES)
+
+# Statuses after which no more process events or samples may be recorded
+_TERMINAL_BATCH_STATUSES = frozenset({"Transferred", "Scrapped"})
+
+# Statuses from which mark_ready_for_transfer is allowed
+_READY_FOR_TRANSFER_FROM = frozenset({"Melting", "Charging"})
+
+# Statuses accepted by update_batch_status
+_VALID_BATCH_STATUSES = frozenset({
+    "Draft", "Charging", "Melting", "Ready for Transfer", "Transferred", "Cancelled"
+})
+_VALID_STATUSES_STR = ", ".join(sorted(_VALID_BATCH_STATUSES))
+
+
+def _opt_flt(value, precision=None):
+    """flt() for optional kiosk inputs: None and "" stay None."""
+    if value is None or value == "":
+        return None
+    return flt(value, precision)
+
+
+def _get_item_names(item_codes):
+    """
+    Return {item_code: item_name} for the given codes.
+
+    Names are memoised for the request and all misses are fetched with a
+    single Item query.
+    """
+    item_name_map = frappe.local.cache.setdefault("swynix_mes:item_name_map", {})
+
+    missing = [code for code in set(item_codes) if code and code not in item_name_map]
+    if missing:
+        item_name_map.update(frappe.get_all(
+            "Item",
+            filters={"name": ["in", missing]},
+            fields=["name", "item_name"],
+            as_list=True
+        ))
+
+    return {code: item_name_map.get(code) for code in item_codes if code}
+
+
+# Identical kiosk error titles are written to Error Log at most once per window
+KIOSK_ERROR_LOG_PREFIX = "swynix_mes:melting_kiosk_error"
+KIOSK_ERROR_LOG_WINDOW = 60  # seconds
+
+
+def _log_kiosk_error(title, message):
+    """
+    frappe.log_error for the non-fatal kiosk fallbacks, throttled per title.
+
+    A broken plan or recipe makes every kiosk click hit the same fallback;
+    one Error Log row per window is enough to diagnose it.
+    """
+    cache_key = f"{KIOSK_ERROR_LOG_PREFIX}:{title}"
+    if frappe.cache().get_value(cache_key):
+        return
+
+    frappe.cache().set_value(cache_key, 1, expires_in_sec=KIOSK_ERROR_LOG_WINDOW)
+    frappe.log_error(title=title, message=message)
+
+
+def _mark_melting_started(batch, title):
+    """
+    Best-effort batch.mark_melting_started_if_first_time().
+
+    The schedule shift runs inside the caller's transaction, so it is rolled
+    back to a savepoint on failure: the caller's batch/charge/log writes are
+    kept and the error is logged. If the database already rolled back the
+    whole transaction (e.g. a deadlock), the savepoint is gone and the
+    request fails instead of reporting success.
+    """
+    frappe.db.savepoint("mark_melting_started")
+    try:
+        batch.mark_melting_started_if_first_time()
+    except Exception as e:
+        frappe.db.rollback(save_point="mark_melting_started")
+        _log_kiosk_error(
+            title=title,
+            message=f"Error shifting schedule for batch {batch.name}: {str(e)}"
+        )
+
+
+def _ensure_batch_open(batch_name):
+    """
+    Throw before loading the batch if it is missing or already finished.
+
+    A single indexed status lookup, so rejected kiosk clicks never pay for
+    a full document load.
+    """
+    status = frappe.db.get_value("Melting Batch", batch_name, "status")
+    if status is None:
+        frappe.throw(_("Melting Batch {0} not found").format(batch_name), frappe.DoesNotExistError)
+
+    if status in _TERMINAL_BATCH_STATUSES:
+        frappe.throw(_("Melting Batch {0} is already {1}.").format(batch_name, status))
+
+
+@request_cache
+def _get_batch(batch_name):
+    """
+    Load a Melting Batch once per request.
+
+    Endpoints that hand the batch on to other helpers (e.g. the QC transfer
+    check) reuse the same document instead of loading it again.
+    """
+    return frappe.get_doc("Melting Batch", batch_name)
 
 
 # ==================== FURNACE AVAILABILITY CHECK ====================
@@ -24,9 +144,17 @@ def check_furnace_availability(furnace):
             - is_free: bool - True if furnace is free
             - active_batch: str or None - Name of active batch if busy
             - active_status: str or None - Status of active batch if busy
+
+    The result is cached for a few seconds per furnace; MeltingBatch
+    invalidates it whenever a batch on the furnace changes.
     """
     if not furnace:
         return {"is_free": True, "active_batch": None, "active_status": None}
+
+    cache_key = get_furnace_availability_cache_key(furnace)
+    result = frappe.cache().get_value(cache_key)
+    if result is not None:
+        return result
     
     # Check for any active batch on this furnace
     active_batch = frappe.db.sql("""
@@ -36,16 +164,19 @@ def check_furnace_availability(furnace):
         AND status IN %s
         AND docstatus < 2
         LIMIT 1
-    """, (furnace, tuple(ACTIVE_BATCH_STATUSES)), as_dict=True)
+    """, (furnace, _ACTIVE_STATUSES_TUPLE), as_dict=True)
     
     if active_batch:
-        return {
+        result = {
             "is_free": False,
             "active_batch": active_batch[0].name,
             "active_status": active_batch[0].status
         }
-    
-    return {"is_free": True, "active_batch": None, "active_status": None}
+    else:
+        result = {"is_free": True, "active_batch": None, "active_status": None}
+
+    frappe.cache().set_value(cache_key, result, expires_in_sec=FURNACE_AVAILABILITY_CACHE_TTL)
+    return result
 
 
 @frappe.whitelist()
@@ -56,6 +187,11 @@ def get_active_batch_statuses():
 
 # ==================== CASTING PLAN INTEGRATION ====================
 
+# Plan statuses listed in the Melting Kiosk; bound as one parameter so the
+# query text stays the same if the set changes
+CAST_PLAN_KIOSK_STATUSES = ("Planned", "Released to Melting", "In Process")
+
+
 @frappe.whitelist()
 def get_cast_plans_for_furnace(furnace, for_date=None):
     """
@@ -77,43 +213,51 @@ def get_cast_plans_for_furnace(furnace, for_date=None):
     else:
         for_date = getdate(for_date)
     
-    # Build date range for the day
-    start_of_day = f"{for_date} 00:00:00"
-    end_of_day = f"{for_date} 23:59:59"
+    # Half-open range [day, next day) bound as datetimes so the start_datetime index is used
+    start_of_day = get_datetime(for_date)
+    end_of_day = start_of_day + timedelta(days=1)
     
-    # Query plans where either caster matches OR furnace matches the selected furnace
-    plans = frappe.db.sql("""
-        SELECT
+    # Query plans where either caster matches OR furnace matches the selected
+    # furnace. The OR is split into two branches so each one range-scans its
+    # own (plan_type, caster|furnace, start_datetime) index.
+    columns = """
             name,
-            cast_no,
-            plan_type,
-            caster,
-            furnace,
             start_datetime,
             end_datetime,
             duration_minutes,
             product_item,
             alloy,
-            temper,
-            charge_mix_recipe,
             planned_width_mm,
             planned_gauge_mm,
             planned_weight_mt,
             status,
-            melting_batch,
-            customer,
-            remarks
+            melting_batch
+    """
+    common_conditions = """
+          AND start_datetime >= %(start)s
+          AND start_datetime < %(end)s
+          AND status IN %(statuses)s
+          AND docstatus < 2
+    """
+    plans = frappe.db.sql(f"""
+        (SELECT {columns}
         FROM `tabPPC Casting Plan`
         WHERE plan_type = 'Casting'
-          AND (caster = %(furnace)s OR furnace = %(furnace)s)
-          AND start_datetime BETWEEN %(start)s AND %(end)s
-          AND status IN ('Planned', 'Released to Melting', 'In Process')
-          AND docstatus < 2
+          AND caster = %(furnace)s
+          {common_conditions})
+        UNION ALL
+        (SELECT {columns}
+        FROM `tabPPC Casting Plan`
+        WHERE plan_type = 'Casting'
+          AND furnace = %(furnace)s
+          AND (caster IS NULL OR caster != %(furnace)s)
+          {common_conditions})
         ORDER BY start_datetime ASC
     """, {
         "furnace": furnace,
         "start": start_of_day,
-        "end": end_of_day
+        "end": end_of_day,
+        "statuses": CAST_PLAN_KIOSK_STATUSES,
     }, as_dict=True)
     
     return plans
@@ -132,7 +276,20 @@ def start_batch_from_cast_plan(plan_name):
     if not plan_name:
         frappe.throw(_("Casting Plan is required."))
 
-    plan = frappe.get_doc("PPC Casting Plan", plan_name)
+    # Only the header fields copied to the batch; the plan document itself
+    # is loaded later by mark_melting_started_if_first_time if needed
+    plan = frappe.db.get_value(
+        "PPC Casting Plan",
+        plan_name,
+        [
+            "name", "melting_batch", "furnace", "caster", "alloy", "product_item",
+            "temper", "charge_mix_recipe", "planned_weight_mt", "planned_width_mm",
+            "planned_gauge_mm", "start_datetime",
+        ],
+        as_dict=True
+    )
+    if not plan:
+        frappe.throw(_("Casting Plan {0} not found").format(plan_name), frappe.DoesNotExistError)
 
     # Check if batch already exists for this plan
     if plan.melting_batch:
@@ -140,26 +297,27 @@ def start_batch_from_cast_plan(plan_name):
 
     # Create Melting Batch
     batch = frappe.new_doc("Melting Batch")
-    # treat caster workstation as furnace name (priority: furnace if set, else caster)
-    batch.furnace = getattr(plan, "furnace", None) or getattr(plan, "caster", None)
-    batch.alloy = getattr(plan, "alloy", None)
-    batch.product_item = getattr(plan, "product_item", None)
-    batch.temper = getattr(plan, "temper", None)
-    batch.charge_mix_recipe = getattr(plan, "charge_mix_recipe", None)
-    batch.planned_weight_mt = getattr(plan, "planned_weight_mt", None)
-    batch.planned_width_mm = getattr(plan, "planned_width_mm", None)
-    batch.planned_gauge_mm = getattr(plan, "planned_gauge_mm", None)
-    batch.plan_date = getdate(plan.start_datetime) if plan.start_datetime else getdate()
-    batch.ppc_casting_plan = plan.name
-    batch.status = "Charging"
-    batch.batch_start_datetime = now_datetime()
+    batch.update({
+        # treat caster workstation as furnace name (priority: furnace if set, else caster)
+        "furnace": plan.furnace or plan.caster,
+        "alloy": plan.alloy,
+        "product_item": plan.product_item,
+        "temper": plan.temper,
+        "charge_mix_recipe": plan.charge_mix_recipe,
+        "planned_weight_mt": plan.planned_weight_mt,
+        "planned_width_mm": plan.planned_width_mm,
+        "planned_gauge_mm": plan.planned_gauge_mm,
+        "plan_date": getdate(plan.start_datetime) if plan.start_datetime else getdate(),
+        "ppc_casting_plan": plan.name,
+        "status": "Charging",
+        "batch_start_datetime": now_datetime(),
+    })
 
     batch.insert()
 
     # Link back to plan
     try:
-        meta_fields = [d.fieldname for d in plan.meta.get("fields")]
-        if "melting_batch" in meta_fields:
+        if frappe.get_meta("PPC Casting Plan").has_field("melting_batch"):
             frappe.db.set_value(
                 "PPC Casting Plan",
                 plan.name,
@@ -169,21 +327,15 @@ def start_batch_from_cast_plan(plan_name):
             )
     except Exception:
         # don't break kiosk if link cannot be set
-        frappe.log_error(
+        _log_kiosk_error(
             title="PPC Casting Plan link error",
             message=f"Could not set melting_batch for plan {plan.name}"
         )
 
     # Trigger melting started logic - this shifts the schedule if needed
-    # (when actual start differs from planned start)
-    try:
-        batch.mark_melting_started_if_first_time()
-    except Exception as e:
-        # Log but don't fail the batch creation
-        frappe.log_error(
-            title="Melting Start Schedule Shift Error",
-            message=f"Error shifting schedule for batch {batch.name}: {str(e)}"
-        )
+    # (when actual start differs from planned start); a failure is logged
+    # and does not fail the batch creation
+    _mark_melting_started(batch, "Melting Start Schedule Shift Error")
 
     return {
         "melting_batch": batch.name,
@@ -203,24 +355,26 @@ def start_batch_from_cast_plan(plan_name):
 @frappe.whitelist()
 def get_furnaces():
     """Return list of furnaces (Workstations with workstation_type = 'Foundry')."""
-    return frappe.get_all(
-        "Workstation",
-        filters={"workstation_type": "Foundry"},
-        fields=["name", "workstation_name"],
-        order_by="workstation_name asc"
-    )
+    return get_workstations("Foundry", sort_field="workstation_name")
 
 
 @frappe.whitelist()
 def get_batches_for_furnace(furnace, for_date=None):
     """
     Return melting batches for a furnace on a given date (default today).
+
+    The result is cached for a few seconds per furnace/date because the kiosk
+    polls it; MeltingBatch invalidates the entry whenever a batch changes.
     """
     if not furnace:
         return []
 
-    if not for_date:
-        for_date = getdate()
+    for_date = getdate(for_date) if for_date else getdate()
+
+    cache_key = get_furnace_batches_cache_key(furnace, for_date)
+    batches = frappe.cache().get_value(cache_key)
+    if batches is not None:
+        return batches
 
     batches = frappe.get_all(
         "Melting Batch",
@@ -248,6 +402,7 @@ def get_batches_for_furnace(furnace, for_date=None):
         order_by="batch_start_datetime asc, creation asc"
     )
 
+    frappe.cache().set_value(cache_key, batches, expires_in_sec=FURNACE_BATCHES_CACHE_TTL)
     return batches
 
 
@@ -287,34 +442,23 @@ def create_melting_batch(data):
         doc.ppc_casting_plan = data.ppc_casting_plan
 
     doc.insert()
-    frappe.db.commit()
 
     return doc.name
 
 
-@frappe.whitelist()
-def add_raw_material_row(batch_name, item_code, qty_kg, ingredient_type=None,
-                         batch_no=None, source_bin=None, bucket_no=None, is_correction=0):
+def _append_raw_material(doc, item_code, qty_kg, ingredient_type=None, batch_no=None,
+                         source_bin=None, bucket_no=None, is_correction=0, item_name=None):
     """
-    Append a raw material row (normal or correction) to Melting Batch.
-    If is_correction is True, also creates a Process Log entry with event_type='Correction'.
-    
-    For the first raw material addition (not correction), this also triggers
-    the schedule shift logic if melting starts earlier/later than planned.
+    Append one raw material row (and a Correction process log for correction rows)
+    to an already loaded Melting Batch. Does not save the document.
     """
-    if not batch_name:
-        frappe.throw(_("Melting Batch is required."))
-
-    doc = frappe.get_doc("Melting Batch", batch_name)
-
-    # Check if this is the first raw material (not correction) - for schedule shift
-    is_first_charge = (len(doc.raw_materials) == 0 and not int(is_correction or 0))
-
-    # Auto-assign row_index
-    row_index = len(doc.raw_materials) + 1
+    is_correction = int(is_correction or 0)
 
+    # Name the row up front so callers can return it without relying on save().
+    # Assigned after append() so the row is still flagged as new and gets inserted.
     row = doc.append("raw_materials", {})
-    row.row_index = row_index
+    row.name = frappe.generate_hash(length=10)
+    row.row_index = len(doc.raw_materials)  # Auto-assign row_index
     row.posting_datetime = now_datetime()  # Set timestamp for charge history tracking
     row.item_code = item_code
     row.qty_kg = flt(qty_kg or 0, 3)
@@ -322,18 +466,12 @@ def add_raw_material_row(batch_name, item_code, qty_kg, ingredient_type=None,
     row.batch_no = batch_no
     row.source_bin = source_bin
     row.bucket_no = bucket_no
-    row.is_correction = int(is_correction or 0)
-
-    # Auto-fetch item_name
-    item_name = None
-    if item_code:
-        item = frappe.db.get_value("Item", item_code, ["item_name"], as_dict=True)
-        if item:
-            row.item_name = item.item_name
-            item_name = item.item_name
+    row.is_correction = is_correction
+    if item_name:
+        row.item_name = item_name
 
     # If this is a correction, also log it in process_logs
-    if int(is_correction or 0):
+    if is_correction:
         # Build a summary note for the process log
         summary_parts = []
         if item_name:
@@ -349,30 +487,77 @@ def add_raw_material_row(batch_name, item_code, qty_kg, ingredient_type=None,
         
         # Append process log entry for the correction
         plog = doc.append("process_logs", {})
-        plog.log_time = now_datetime()
+        plog.log_time = row.posting_datetime
         plog.event_type = "Correction"
         plog.note = summary
 
-    # Recalculate charged_weight_mt and yield%
-    total_kg = sum([flt(r.qty_kg) for r in doc.raw_materials])
-    doc.charged_weight_mt = flt(total_kg / 1000.0, 3)
+    return row
 
-    if doc.tapped_weight_mt and doc.charged_weight_mt:
-        doc.yield_percent = flt((doc.tapped_weight_mt / doc.charged_weight_mt) * 100, 2)
 
-    doc.save()
-    frappe.db.commit()
+def _save_raw_materials(doc, is_first_charge):
+    """
+    Insert the appended raw material (and correction log) rows, update the
+    charged weight and yield on the batch and trigger the first-charge
+    schedule shift when applicable.
+    """
+    doc.insert_new_child_rows()
+
+    # Sum the stored rows in SQL and round once, as calculate_charged_weight
+    # does; the batch row is locked by insert_new_child_rows, so concurrent
+    # charges cannot lose each other's rows
+    charged_kg = frappe.db.sql("""
+        SELECT IFNULL(SUM(qty_kg), 0)
+        FROM `tabMelting Batch Raw Material`
+        WHERE parent = %s AND parenttype = 'Melting Batch' AND parentfield = 'raw_materials'
+    """, (doc.name,))[0][0]
+    doc.charged_weight_mt = flt(flt(charged_kg) / 1000, 3)
+    doc.calculate_yield_percent()
+    doc.db_set({
+        "charged_weight_mt": doc.charged_weight_mt,
+        "yield_percent": doc.yield_percent,
+    }, update_modified=False)
 
     # Trigger melting started logic on first charge
     # This shifts the schedule if actual start differs from planned start
     if is_first_charge:
-        try:
-            doc.mark_melting_started_if_first_time()
-        except Exception as e:
-            frappe.log_error(
-                title="First Charge Schedule Shift Error",
-                message=f"Error shifting schedule for batch {batch_name}: {str(e)}"
-            )
+        _mark_melting_started(doc, "First Charge Schedule Shift Error")
+
+
+@frappe.whitelist()
+def add_raw_material_row(batch_name, item_code, qty_kg, ingredient_type=None,
+                         batch_no=None, source_bin=None, bucket_no=None, is_correction=0,
+                         item_name=None):
+    """
+    Append a raw material row (normal or correction) to Melting Batch.
+    If is_correction is True, also creates a Process Log entry with event_type='Correction'.
+    If the kiosk already knows the item_name it can pass it to skip the Item lookup.
+    
+    For the first raw material addition (not correction), this also triggers
+    the schedule shift logic if melting starts earlier/later than planned.
+    """
+    if not batch_name:
+        frappe.throw(_("Melting Batch is required."))
+
+    doc = _get_batch(batch_name)
+
+    # Check if this is the first raw material (not correction) - for schedule shift
+    is_first_charge = (len(doc.raw_materials) == 0 and not int(is_correction or 0))
+
+    # Auto-fetch item_name
+    if item_code and not item_name:
+        item_name = _get_item_names([item_code]).get(item_code)
+
+    row = _append_raw_material(
+        doc, item_code, qty_kg,
+        ingredient_type=ingredient_type,
+        batch_no=batch_no,
+        source_bin=source_bin,
+        bucket_no=bucket_no,
+        is_correction=is_correction,
+        item_name=item_name,
+    )
+
+    _save_raw_materials(doc, is_first_charge)
 
     return {
         "row_name": row.name,
@@ -381,6 +566,61 @@ def add_raw_material_row(batch_name, item_code, qty_kg, ingredient_type=None,
     }
 
 
+@frappe.whitelist()
+def add_raw_material_rows(batch_name, rows):
+    """
+    Append several raw material rows to a Melting Batch in one call.
+
+    Used by the kiosk when the operator charges several buckets back-to-back:
+    the batch is loaded and its totals updated once instead of once per row.
+
+    rows: list (or JSON string) of dicts with the same keys as the
+    add_raw_material_row arguments (item_code, qty_kg, ingredient_type,
+    batch_no, source_bin, bucket_no, is_correction).
+    """
+    import json
+    if isinstance(rows, str):
+        rows = json.loads(rows)
+
+    if not batch_name:
+        frappe.throw(_("Melting Batch is required."))
+
+    rows = [frappe._dict(r) for r in rows or []]
+    if not rows:
+        frappe.throw(_("At least one raw material row is required."))
+
+    doc = _get_batch(batch_name)
+
+    # Check if this is the first raw material (not correction) - for schedule shift
+    is_first_charge = (
+        len(doc.raw_materials) == 0
+        and any(not int(r.get("is_correction") or 0) for r in rows)
+    )
+
+    # Auto-fetch item names for all rows in one query
+    item_names = _get_item_names([r.get("item_code") for r in rows])
+
+    added = []
+    for r in rows:
+        added.append(_append_raw_material(
+            doc, r.get("item_code"), r.get("qty_kg"),
+            ingredient_type=r.get("ingredient_type"),
+            batch_no=r.get("batch_no"),
+            source_bin=r.get("source_bin"),
+            bucket_no=r.get("bucket_no"),
+            is_correction=r.get("is_correction"),
+            item_name=r.get("item_name") or item_names.get(r.get("item_code")),
+        ))
+
+    _save_raw_materials(doc, is_first_charge)
+
+    return {
+        "row_names": [row.name for row in added],
+        "charged_weight_mt": doc.charged_weight_mt,
+        "yield_percent": doc.yield_percent
+    }
+
+
 @frappe.whitelist()
 def log_process_event(batch_name, event_type, temp_c=None, pressure_bar=None,
                       flux_type=None, flux_qty_kg=None, sample_id=None, note=None):
@@ -403,39 +643,36 @@ def log_process_event(batch_name, event_type, temp_c=None, pressure_bar=None,
     if not event_type:
         frappe.throw(_("Event Type is required."))
 
-    doc = frappe.get_doc("Melting Batch", batch_name)
+    _ensure_batch_open(batch_name)
+    doc = _get_batch(batch_name)
 
     row = doc.append("process_logs", {})
+    row.name = row_name = frappe.generate_hash(length=10)
     row.log_time = now_datetime()
     row.event_type = event_type
-    row.temp_c = flt(temp_c) if temp_c else None
-    row.pressure_bar = flt(pressure_bar) if pressure_bar else None
+    row.temp_c = _opt_flt(temp_c)
+    row.pressure_bar = _opt_flt(pressure_bar)
     row.flux_type = flux_type
-    row.flux_qty_kg = flt(flux_qty_kg) if flux_qty_kg else None
+    row.flux_qty_kg = _opt_flt(flux_qty_kg)
     row.sample_id = sample_id
     row.note = note
 
     # Set batch_start on first Burner On
     is_first_burner_on = (event_type == "Burner On" and not doc.batch_start_datetime)
     if is_first_burner_on:
+        # A parent field changes, so go through a full save
         doc.batch_start_datetime = row.log_time
-
-    doc.save()
-    frappe.db.commit()
+        doc.save()
+    else:
+        doc.insert_new_child_rows()
 
     # Trigger melting started logic on first Burner On
     # This shifts the schedule if actual start differs from planned start
     if is_first_burner_on:
-        try:
-            doc.mark_melting_started_if_first_time()
-        except Exception as e:
-            frappe.log_error(
-                title="Burner Start Schedule Shift Error",
-                message=f"Error shifting schedule for batch {batch_name}: {str(e)}"
-            )
+        _mark_melting_started(doc, "Burner Start Schedule Shift Error")
 
     return {
-        "name": row.name,
+        "name": row_name,
         "log_time": str(row.log_time)
     }
 
@@ -455,6 +692,8 @@ def create_sample(batch_name):
     """
     if not batch_name:
         frappe.throw(_("Melting Batch is required."))
+
+    _ensure_batch_open(batch_name)
     
     # Use the QC API's sample creation function for full ACCM integration
     from swynix_mes.swynix_mes.api.qc_kiosk import create_spectro_sample
@@ -489,15 +728,15 @@ def mark_ready_for_transfer(batch_name, skip_qc_check=False):
     if not batch_name:
         frappe.throw(_("Melting Batch is required."))
 
-    doc = frappe.get_doc("Melting Batch", batch_name)
+    doc = _get_batch(batch_name)
 
-    if doc.status not in ["Melting", "Charging"]:
+    if doc.status not in _READY_FOR_TRANSFER_FROM:
         frappe.throw(_("Batch must be in Melting or Charging status to mark ready for transfer. Current: {0}").format(doc.status))
 
     # Check QC status
-    from swynix_mes.swynix_mes.api.qc_kiosk import check_qc_for_transfer
+    from swynix_mes.swynix_mes.api.qc_kiosk import get_qc_transfer_status
     
-    qc_result = check_qc_for_transfer(batch_name)
+    qc_result = get_qc_transfer_status(doc)
     qc_warning = None
     
     if not skip_qc_check:
@@ -526,7 +765,6 @@ def mark_ready_for_transfer(batch_name, skip_qc_check=False):
     # Keep existing qc_status if pending (might already be set)
     
     doc.save()
-    frappe.db.commit()
 
     return {
         "status": doc.status,
@@ -540,20 +778,24 @@ def mark_ready_for_transfer(batch_name, skip_qc_check=False):
 def start_transfer(batch_name):
     """
     Start the transfer process - records transfer_start_datetime.
+
+    Only a timestamp changes (no status change, no child rows), so the batch
+    is updated in place instead of being re-saved. insert_new_child_rows
+    keeps the permission, draft and concurrency checks of a save and clears
+    the kiosk caches.
     """
     if not batch_name:
         frappe.throw(_("Melting Batch is required."))
 
-    doc = frappe.get_doc("Melting Batch", batch_name)
+    doc = _get_batch(batch_name)
 
     if doc.status != "Ready for Transfer":
         frappe.throw(_("Batch must be Ready for Transfer to start transfer. Current: {0}").format(doc.status))
 
-    doc.transfer_start_datetime = now_datetime()
-    doc.save()
-    frappe.db.commit()
+    transfer_start = now_datetime()
+    doc.insert_new_child_rows(transfer_start_datetime=transfer_start)
 
-    return {"transfer_start_datetime": str(doc.transfer_start_datetime)}
+    return {"transfer_start_datetime": str(transfer_start)}
 
 
 @frappe.whitelist()
@@ -566,43 +808,38 @@ def complete_transfer(batch_name, tapped_weight_mt=None, fo_temp_c=None,
     if not batch_name:
         frappe.throw(_("Melting Batch is required."))
 
-    doc = frappe.get_doc("Melting Batch", batch_name)
+    doc = _get_batch(batch_name)
 
-    if doc.status not in ["Ready for Transfer"]:
+    if doc.status != "Ready for Transfer":
         frappe.throw(_("Batch must be Ready for Transfer to complete transfer. Current: {0}").format(doc.status))
 
-    if tapped_weight_mt is not None and tapped_weight_mt != "":
-        doc.tapped_weight_mt = flt(tapped_weight_mt, 3)
-
-    if fo_temp_c is not None and fo_temp_c != "":
-        doc.fo_temp_c = flt(fo_temp_c, 1)
-
-    if fo_pressure_bar is not None and fo_pressure_bar != "":
-        doc.fo_pressure_bar = flt(fo_pressure_bar, 2)
-
-    if dross_weight_kg is not None and dross_weight_kg != "":
-        doc.dross_weight_kg = flt(dross_weight_kg, 3)
-
-    if energy_fuel_litre is not None and energy_fuel_litre != "":
-        doc.energy_fuel_litre = flt(energy_fuel_litre, 2)
+    # Only overwrite readings that were actually entered
+    for fieldname, value, precision in (
+        ("tapped_weight_mt", tapped_weight_mt, 3),
+        ("fo_temp_c", fo_temp_c, 1),
+        ("fo_pressure_bar", fo_pressure_bar, 2),
+        ("dross_weight_kg", dross_weight_kg, 3),
+        ("energy_fuel_litre", energy_fuel_litre, 2),
+    ):
+        value = _opt_flt(value, precision)
+        if value is not None:
+            doc.set(fieldname, value)
 
-    doc.transfer_end_datetime = now_datetime()
-    doc.batch_end_datetime = now_datetime()
+    transfer_end = now_datetime()
+    doc.transfer_end_datetime = transfer_end
+    doc.batch_end_datetime = transfer_end
     doc.status = "Transferred"
 
-    # Recalculate yield
-    if doc.charged_weight_mt and doc.tapped_weight_mt:
-        doc.yield_percent = flt((doc.tapped_weight_mt / doc.charged_weight_mt) * 100, 2)
+    # yield_percent is recomputed by MeltingBatch.validate on save
 
     # Add process log for transfer
     if note:
         prow = doc.append("process_logs", {})
-        prow.log_time = doc.transfer_end_datetime
+        prow.log_time = transfer_end
         prow.event_type = "Transfer"
         prow.note = note
 
     doc.save()
-    frappe.db.commit()
 
     return {
         "status": doc.status,
@@ -622,51 +859,64 @@ def update_batch_status(batch_name, new_status):
     if not new_status:
         frappe.throw(_("New status is required."))
 
-    valid_statuses = ["Draft", "Charging", "Melting", "Ready for Transfer", "Transferred", "Cancelled"]
-    if new_status not in valid_statuses:
-        frappe.throw(_("Invalid status: {0}. Valid statuses: {1}").format(new_status, ", ".join(valid_statuses)))
+    if new_status not in _VALID_BATCH_STATUSES:
+        frappe.throw(_("Invalid status: {0}. Valid statuses: {1}").format(new_status, _VALID_STATUSES_STR))
 
-    doc = frappe.get_doc("Melting Batch", batch_name)
+    doc = _get_batch(batch_name)
     doc.status = new_status
     doc.save()
-    frappe.db.commit()
 
     return doc.status
 
 
 @frappe.whitelist()
-def get_batch_detail(batch_name):
+def get_batch_detail(batch_name, v=1):
     """
     Return a full view of a Melting Batch, including:
     - basic batch fields
     - linked casting plan summary (if any)
     - charge mix recipe summary and ingredients with target kg
+    - raw materials, process logs and spectro samples
 
     This is used by the Melting Kiosk to show header card and recipe targets.
+
+    With v=2 the batch fields are returned only once, under "batch". The
+    default (v=1) also repeats them at the top level for older callers.
     """
     if not batch_name:
         frappe.throw(_("Melting Batch is required."))
 
-    doc = frappe.get_doc("Melting Batch", batch_name)
+    doc = frappe.db.get_value(
+        "Melting Batch",
+        batch_name,
+        [
+            "name", "melting_batch_id", "status", "furnace", "alloy", "product_item",
+            "temper", "charge_mix_recipe", "plan_date", "planned_width_mm",
+            "planned_gauge_mm", "planned_weight_mt", "charged_weight_mt",
+            "tapped_weight_mt", "yield_percent", "batch_start_datetime",
+            "batch_end_datetime", "transfer_start_datetime", "transfer_end_datetime",
+            "fo_temp_c", "fo_pressure_bar", "dross_weight_kg", "energy_fuel_litre",
+            "remarks", "ppc_casting_plan",
+        ],
+        as_dict=True
+    )
+    if not doc:
+        frappe.throw(_("Melting Batch {0} not found").format(batch_name), frappe.DoesNotExistError)
 
     # ---------- Plan info ----------
     plan_info = None
     if getattr(doc, "ppc_casting_plan", None):
-        try:
-            plan = frappe.get_doc("PPC Casting Plan", doc.ppc_casting_plan)
-            plan_info = {
-                "name": plan.name,
-                "planned_width_mm": getattr(plan, "planned_width_mm", None),
-                "planned_gauge_mm": getattr(plan, "planned_gauge_mm", None),
-                "final_width_mm": getattr(plan, "final_width_mm", None),
-                "final_gauge_mm": getattr(plan, "final_gauge_mm", None),
-                "planned_weight_mt": getattr(plan, "planned_weight_mt", None),
-                "charge_mix_recipe": getattr(plan, "charge_mix_recipe", None),
-                "customer": getattr(plan, "customer", None),
-                "temper": getattr(plan, "temper", None),
-            }
-        except Exception:
-            plan_info = None
+        # Only the header fields shown on the kiosk; no child tables needed
+        plan_info = frappe.db.get_value(
+            "PPC Casting Plan",
+            doc.ppc_casting_plan,
+            [
+                "name", "planned_width_mm", "planned_gauge_mm", "final_width_mm",
+                "final_gauge_mm", "planned_weight_mt", "charge_mix_recipe",
+                "customer", "temper",
+            ],
+            as_dict=True
+        )
     
     # ---------- Determine which recipe to use ----------
     recipe_name = getattr(doc, "charge_mix_recipe", None)
@@ -684,58 +934,48 @@ def get_batch_detail(batch_name):
     )
 
     if recipe_name:
-        try:
-            cmr = frappe.get_doc("Charge Mix Ratio", recipe_name)
-            recipe_info = {
-                "name": cmr.name,
-                "recipe_code": getattr(cmr, "recipe_code", None),
-                "alloy": getattr(cmr, "alloy", None),
-                "min_recovery_pct": getattr(cmr, "min_recovery_pct", None),
-                "remarks": getattr(cmr, "remarks", None),
-            }
-
-            # child table is cmr.ingredients
-            ingredients = getattr(cmr, "ingredients", []) or []
+        recipe_info = frappe.db.get_value(
+            "Charge Mix Ratio",
+            recipe_name,
+            ["name", "recipe_code", "alloy", "min_recovery_pct", "remarks"],
+            as_dict=True
+        )
+
+        if recipe_info:
+            # child table is Charge Mix Ratio.ingredients
+            ingredients = frappe.get_all(
+                "Charge Mix Ratio Ingredient",
+                filters={
+                    "parent": recipe_name,
+                    "parenttype": "Charge Mix Ratio",
+                    "parentfield": "ingredients",
+                },
+                fields=[
+                    "ingredient", "ingredient_name", "item_group", "proportion_type",
+                    "exact_pct", "min_pct", "max_pct", "default_pct", "mandatory", "sequence",
+                ],
+                order_by="idx asc"
+            )
+            # Target kg per 1% of the planned charge, hoisted out of the loop
+            kg_per_pct = flt(planned_weight_mt) * 1000.0 / 100.0
             for row in ingredients:
                 # Determine target percentage based on proportion_type
-                proportion_type = getattr(row, "proportion_type", "Exact")
-                if proportion_type == "Exact":
-                    target_pct = flt(getattr(row, "exact_pct", 0))
-                else:
+                if row.proportion_type == "Exact":
+                    target_pct = flt(row.exact_pct)
+                elif row.default_pct:
                     # For Range, use default_pct or midpoint of min/max
-                    default_pct = getattr(row, "default_pct", None)
-                    if default_pct:
-                        target_pct = flt(default_pct)
-                    else:
-                        min_pct = flt(getattr(row, "min_pct", 0))
-                        max_pct = flt(getattr(row, "max_pct", 0))
-                        target_pct = (min_pct + max_pct) / 2 if (min_pct or max_pct) else 0
-
-                min_pct = getattr(row, "min_pct", None)
-                max_pct = getattr(row, "max_pct", None)
-
-                # Calculate target kg based on planned weight
-                target_kg = None
-                if planned_weight_mt and target_pct:
-                    target_kg = flt(planned_weight_mt) * 1000.0 * (target_pct / 100.0)
-
-                recipe_items.append({
-                    "ingredient": getattr(row, "ingredient", None),
-                    "ingredient_name": getattr(row, "ingredient_name", None),
-                    "item_group": getattr(row, "item_group", None),
-                    "proportion_type": proportion_type,
-                    "target_pct": target_pct,
-                    "exact_pct": getattr(row, "exact_pct", None),
-                    "min_pct": min_pct,
-                    "max_pct": max_pct,
-                    "default_pct": getattr(row, "default_pct", None),
-                    "mandatory": getattr(row, "mandatory", 0),
-                    "sequence": getattr(row, "sequence", 0),
-                    "target_kg": target_kg,
-                })
-        except Exception:
-            recipe_info = None
-            recipe_items = []
+                    target_pct = flt(row.default_pct)
+                elif row.min_pct or row.max_pct:
+                    target_pct = (flt(row.min_pct) + flt(row.max_pct)) / 2
+                else:
+                    target_pct = 0
+
+                # get_all rows are already dicts with the recipe fields; add
+                # the computed targets in place instead of copying each row
+                row.target_pct = target_pct
+                row.target_kg = target_pct * kg_per_pct if (kg_per_pct and target_pct) else None
+
+            recipe_items = ingredients
 
     # ---------- Build batch info ----------
     batch_info = {
@@ -766,87 +1006,42 @@ def get_batch_detail(batch_name):
         "ppc_casting_plan": getattr(doc, "ppc_casting_plan", None),
     }
 
-    return {
+    result = {
         "batch": batch_info,
         "plan": plan_info,
         "recipe": recipe_info,
         "recipe_items": recipe_items,
-        # Keep backward compatibility with existing code
-        "name": doc.name,
-        "melting_batch_id": getattr(doc, "melting_batch_id", None),
-        "status": doc.status,
-        "furnace": doc.furnace,
-        "alloy": doc.alloy,
-        "product_item": doc.product_item,
-        "temper": getattr(doc, "temper", None),
-        "charge_mix_recipe": recipe_name,
-        "plan_date": str(doc.plan_date) if doc.plan_date else None,
-        "planned_width_mm": getattr(doc, "planned_width_mm", None),
-        "planned_gauge_mm": getattr(doc, "planned_gauge_mm", None),
-        "planned_weight_mt": doc.planned_weight_mt,
-        "charged_weight_mt": doc.charged_weight_mt,
-        "tapped_weight_mt": doc.tapped_weight_mt,
-        "yield_percent": doc.yield_percent,
-        "batch_start_datetime": str(doc.batch_start_datetime) if doc.batch_start_datetime else None,
-        "batch_end_datetime": str(doc.batch_end_datetime) if doc.batch_end_datetime else None,
-        "transfer_start_datetime": str(doc.transfer_start_datetime) if doc.transfer_start_datetime else None,
-        "transfer_end_datetime": str(doc.transfer_end_datetime) if doc.transfer_end_datetime else None,
-        "fo_temp_c": doc.fo_temp_c,
-        "fo_pressure_bar": doc.fo_pressure_bar,
-        "dross_weight_kg": doc.dross_weight_kg,
-        "energy_fuel_litre": doc.energy_fuel_litre,
-        "remarks": doc.remarks,
-        "ppc_casting_plan": getattr(doc, "ppc_casting_plan", None),
-        "raw_materials": [
-            {
-                "name": r.name,
-                "row_index": r.row_index,
-                "ingredient_type": r.ingredient_type,
-                "item_code": r.item_code,
-                "item_name": r.item_name,
-                "batch_no": r.batch_no,
-                "source_bin": r.source_bin,
-                "bucket_no": r.bucket_no,
-                "qty_kg": r.qty_kg,
-                "is_correction": r.is_correction
-            }
-            for r in doc.raw_materials
-        ],
-        "process_logs": [
-            {
-                "name": p.name,
-                "log_time": str(p.log_time) if p.log_time else None,
-                "event_type": p.event_type,
-                "temp_c": p.temp_c,
-                "pressure_bar": p.pressure_bar,
-                "flux_type": p.flux_type,
-                "flux_qty_kg": p.flux_qty_kg,
-                "sample_id": p.sample_id,
-                "note": p.note
-            }
-            for p in doc.process_logs
-        ],
-        "spectro_samples": [
-            {
-                "name": s.name,
-                "sample_id": s.sample_id,
-                "sample_time": str(s.sample_time) if s.sample_time else None,
-                "si_percent": s.si_percent,
-                "fe_percent": s.fe_percent,
-                "cu_percent": s.cu_percent,
-                "mn_percent": s.mn_percent,
-                "mg_percent": s.mg_percent,
-                "zn_percent": s.zn_percent,
-                "ti_percent": s.ti_percent,
-                "al_percent": s.al_percent,
-                "result_status": s.result_status,
-                "correction_required": s.correction_required,
-                "remarks": s.remarks
-            }
-            for s in doc.spectro_samples
-        ]
+        # Child rows are selected in the exact shape the kiosk renders
+        "raw_materials": frappe.db.sql("""
+            SELECT name, row_index, ingredient_type, item_code, item_name,
+                   batch_no, source_bin, bucket_no, qty_kg, is_correction
+            FROM `tabMelting Batch Raw Material`
+            WHERE parent = %s AND parenttype = 'Melting Batch' AND parentfield = 'raw_materials'
+            ORDER BY idx ASC
+        """, (doc.name,), as_dict=True),
+        "process_logs": frappe.db.sql("""
+            SELECT name, log_time, event_type, temp_c, pressure_bar,
+                   flux_type, flux_qty_kg, sample_id, note
+            FROM `tabMelting Batch Process Log`
+            WHERE parent = %s AND parenttype = 'Melting Batch' AND parentfield = 'process_logs'
+            ORDER BY idx ASC
+        """, (doc.name,), as_dict=True),
+        "spectro_samples": frappe.db.sql("""
+            SELECT name, sample_id, sample_time, si_percent, fe_percent, cu_percent,
+                   mn_percent, mg_percent, zn_percent, ti_percent, al_percent,
+                   result_status, correction_required, remarks
+            FROM `tabMelting Batch Spectro Sample`
+            WHERE parent = %s AND parenttype = 'Melting Batch' AND parentfield = 'spectro_samples'
+            ORDER BY idx ASC
+        """, (doc.name,), as_dict=True),
     }
 
+    if cint(v) < 2:
+        # Keep backward compatibility with existing code
+        result.update(batch_info)
+
+    return result
+
 
 # ==================== SPECTRO SAMPLES WITH COMPOSITION SPEC ====================
 
@@ -865,8 +1060,72 @@ ELEMENT_FIELD_MAP = {
 
 # Default element display order
 DEFAULT_ELEMENT_ORDER = ["Si", "Fe", "Cu", "Mn", "Mg", "Zn", "Ti", "Al"]
-
-
+# Position of each element in DEFAULT_ELEMENT_ORDER, for sort keys
+_ELEMENT_ORDER_RANK = {code: rank for rank, code in enumerate(DEFAULT_ELEMENT_ORDER)}
+
+
+# Common element symbol mappings (read-only; built once at import)
+_ELEMENT_SYMBOLS = MappingProxyType({
+    "silicon": "Si", "si": "Si",
+    "iron": "Fe", "fe": "Fe",
+    "copper": "Cu", "cu": "Cu",
+    "manganese": "Mn", "mn": "Mn",
+    "magnesium": "Mg", "mg": "Mg",
+    "zinc": "Zn", "zn": "Zn",
+    "titanium": "Ti", "ti": "Ti",
+    "aluminium": "Al", "aluminum": "Al", "al": "Al",
+    "chromium": "Cr", "cr": "Cr",
+    "nickel": "Ni", "ni": "Ni",
+    "lead": "Pb", "pb": "Pb",
+    "tin": "Sn", "sn": "Sn",
+    "vanadium": "V", "v": "V",
+    "zirconium": "Zr", "zr": "Zr",
+    "boron": "B", "b": "B",
+    "calcium": "Ca", "ca": "Ca",
+    "sodium": "Na", "na": "Na",
+    "phosphorus": "P", "p": "P",
+    "sulfur": "S", "s": "S",
+    "beryllium": "Be", "be": "Be",
+    "bismuth": "Bi", "bi": "Bi",
+    "cadmium": "Cd", "cd": "Cd",
+    "gallium": "Ga", "ga": "Ga",
+    "lithium": "Li", "li": "Li",
+    "strontium": "Sr", "sr": "Sr",
+})
+
+
+def _group_synonyms_by_length(symbols):
+    """((length, ((synonym, symbol), ...)), ...) with the longest synonyms first."""
+    by_len = defaultdict(list)
+    for key, symbol in symbols.items():
+        by_len[len(key)].append((key, symbol))
+    return tuple((length, tuple(by_len[length])) for length in sorted(by_len, reverse=True))
+
+
+# Synonyms for the partial match bucketed by length, longest first so that
+# e.g. "magnesium" wins over the "si" it contains
+_ELEMENT_SYMBOLS_BY_LEN = _group_synonyms_by_length(_ELEMENT_SYMBOLS)
+
+
+def element_code_exact(item_lower):
+    """Element symbol for an exact (lower-cased) synonym, or None."""
+    return _ELEMENT_SYMBOLS.get(item_lower)
+
+
+def element_code_contains(item_lower):
+    """Element symbol of the longest synonym contained in a lower-cased name, or None."""
+    name_len = len(item_lower)
+    for length, pairs in _ELEMENT_SYMBOLS_BY_LEN:
+        # Synonyms longer than the name cannot be contained in it
+        if length > name_len:
+            continue
+        for key, symbol in pairs:
+            if key in item_lower:
+                return symbol
+    return None
+
+
+@lru_cache(maxsize=1024)
 def get_element_code_from_item(item_name):
     """
     Extract element code from item name.
@@ -876,50 +1135,72 @@ def get_element_code_from_item(item_name):
     if not item_name:
         return None
     
-    # Common element symbol mappings
-    element_symbols = {
-        "silicon": "Si", "si": "Si",
-        "iron": "Fe", "fe": "Fe",
-        "copper": "Cu", "cu": "Cu",
-        "manganese": "Mn", "mn": "Mn",
-        "magnesium": "Mg", "mg": "Mg",
-        "zinc": "Zn", "zn": "Zn",
-        "titanium": "Ti", "ti": "Ti",
-        "aluminium": "Al", "aluminum": "Al", "al": "Al",
-        "chromium": "Cr", "cr": "Cr",
-        "nickel": "Ni", "ni": "Ni",
-        "lead": "Pb", "pb": "Pb",
-        "tin": "Sn", "sn": "Sn",
-        "vanadium": "V", "v": "V",
-        "zirconium": "Zr", "zr": "Zr",
-        "boron": "B", "b": "B",
-        "calcium": "Ca", "ca": "Ca",
-        "sodium": "Na", "na": "Na",
-        "phosphorus": "P", "p": "P",
-        "sulfur": "S", "s": "S",
-        "beryllium": "Be", "be": "Be",
-        "bismuth": "Bi", "bi": "Bi",
-        "cadmium": "Cd", "cd": "Cd",
-        "gallium": "Ga", "ga": "Ga",
-        "lithium": "Li", "li": "Li",
-        "strontium": "Sr", "sr": "Sr",
-    }
-    
     # Try direct match first (for codes like "Si", "Fe")
     item_lower = item_name.strip().lower()
-    if item_lower in element_symbols:
-        return element_symbols[item_lower]
+    code = element_code_exact(item_lower)
+    if code:
+        return code
     
     # Check if item_name is already a valid 1-2 char element symbol
     if len(item_name) <= 2 and item_name.capitalize() in ELEMENT_FIELD_MAP:
         return item_name.capitalize()
     
     # Try partial match
-    for key, symbol in element_symbols.items():
-        if key in item_lower:
-            return symbol
-    
-    return item_name  # Return as-is if no match
+    return element_code_contains(item_lower) or item_name  # Return as-is if no match
+
+
+# Rule fields naming the elements of a Sum Limit group
+_SUM_ELEMENT_KEYS = ("element_1", "element_2", "element_3")
+
+
+def _sum_element_codes(rule):
+    """Element codes of the elements set on a Sum Limit rule."""
+    return [get_element_code_from_item(rule[key]) for key in _SUM_ELEMENT_KEYS if rule.get(key)]
+
+
+def _classify_normal_limit(limit_type, min_pct, max_pct):
+    """
+    Reduce a Normal Limit rule to (kind, low, high) with kind one of
+    "range", "max", "min", "eq" or None.
+
+    Kept free of string formatting so it can be profiled on its own; it is
+    plain Python since spec text is built once per rule per request.
+    """
+    has_min = min_pct is not None
+    has_max = max_pct is not None
+
+    if limit_type == "Range" and has_min and has_max:
+        return "range", min_pct, max_pct
+    if limit_type == "Maximum" and has_max:
+        return "max", None, max_pct
+    if limit_type == "Minimum" and has_min:
+        return "min", min_pct, None
+    if limit_type == "Equal To":
+        if has_min:
+            return "eq", min_pct, None
+        if has_max:
+            return "eq", max_pct, None
+        return None, None, None
+    if has_max and not has_min:
+        return "max", None, max_pct
+    if has_min and not has_max:
+        return "min", min_pct, None
+    if has_min and has_max:
+        return "range", min_pct, max_pct
+    return None, None, None
+
+
+def _format_normal_limit(kind, low, high):
+    """Spec text for the (kind, low, high) returned by _classify_normal_limit."""
+    if kind == "range":
+        return f"{flt(low, 4)}–{flt(high, 4)}"
+    if kind == "max":
+        return f"≤ {flt(high, 4)}"
+    if kind == "min":
+        return f"≥ {flt(low, 4)}"
+    if kind == "eq":
+        return f"= {flt(low, 4)}"
+    return "-"
 
 
 def build_spec_text(rule):
@@ -941,33 +1222,11 @@ def build_spec_text(rule):
     condition_text = ""
     
     if condition_type == "Normal Limit":
-        if limit_type == "Range" and min_pct is not None and max_pct is not None:
-            spec_text = f"{flt(min_pct, 4)}–{flt(max_pct, 4)}"
-        elif limit_type == "Maximum" and max_pct is not None:
-            spec_text = f"≤ {flt(max_pct, 4)}"
-        elif limit_type == "Minimum" and min_pct is not None:
-            spec_text = f"≥ {flt(min_pct, 4)}"
-        elif limit_type == "Equal To":
-            if min_pct is not None:
-                spec_text = f"= {flt(min_pct, 4)}"
-            elif max_pct is not None:
-                spec_text = f"= {flt(max_pct, 4)}"
-        elif max_pct is not None and min_pct is None:
-            spec_text = f"≤ {flt(max_pct, 4)}"
-        elif min_pct is not None and max_pct is None:
-            spec_text = f"≥ {flt(min_pct, 4)}"
-        elif min_pct is not None and max_pct is not None:
-            spec_text = f"{flt(min_pct, 4)}–{flt(max_pct, 4)}"
+        spec_text = _format_normal_limit(*_classify_normal_limit(limit_type, min_pct, max_pct))
     
     elif condition_type == "Sum Limit":
         # Build sum group label
-        elements = []
-        if rule.get("element_1"):
-            elements.append(get_element_code_from_item(rule["element_1"]))
-        if rule.get("element_2"):
-            elements.append(get_element_code_from_item(rule["element_2"]))
-        if rule.get("element_3"):
-            elements.append(get_element_code_from_item(rule["element_3"]))
+        elements = _sum_element_codes(rule)
         
         sum_label = "+".join(elements) if elements else "Sum"
         
@@ -1011,98 +1270,83 @@ def build_spec_text(rule):
     return spec_text, condition_text
 
 
-@frappe.whitelist()
-def get_spectro_context(melting_batch):
+# Composition rule fields used to build the spectro table
+SPECTRO_RULE_FIELDS = [
+    "condition_type", "limit_type", "min_percentage", "max_percentage",
+    "sum_limit_type", "sum_min_percentage", "sum_max_percentage",
+    "remainder_min_percentage", "ratio_value_1", "ratio_value_2", "ratio_value_3",
+    "notes", "element_1", "element_2", "element_3", "is_mandatory",
+]
+
+
+# Cached element/sum-rule layout per composition master version
+SPECTRO_ELEMENTS_CACHE_PREFIX = "swynix_mes:spectro_elements"
+SPECTRO_ELEMENTS_CACHE_TTL = 3600  # seconds
+
+
+def _element_sort_key(el):
+    """Sort elements by default order (known elements first, then others)"""
+    code = el.get("code", "")
+    rank = _ELEMENT_ORDER_RANK.get(code)
+    if rank is not None:
+        return rank
+    return 100 + ord(code[0]) if code else 999
+
+
+def _build_spectro_elements(composition_master):
     """
-    Return spectro sample context for a melting batch, including:
-    - elements: List of elements with spec from Alloy Chemical Composition Master
-    - samples: List of spectro samples with values mapped to element codes
-    - sum_rules: List of sum limit rules for validation
-    
-    This is used by the Melting Kiosk to render a dynamic spectro table.
+    Return (elements, sum_rules) for the spectro table of a composition
+    master, or the default element list when there is none.
     """
-    if not melting_batch:
-        return {"elements": [], "samples": [], "sum_rules": [], "alloy": None}
-    
-    doc = frappe.get_doc("Melting Batch", melting_batch)
-    alloy = doc.alloy
-    
     elements = []
     sum_rules = []
     element_codes_added = set()
     
-    if alloy:
-        # Find the active composition master for this alloy
-        composition_master = frappe.db.get_value(
-            "Alloy Chemical Composition Master",
-            {"alloy": alloy, "is_active": 1},
-            "name"
+    if composition_master:
+        # Flat child rows are enough here; skip loading the master document
+        rules = frappe.get_all(
+            "Alloy Chemical Rule Detail",
+            filters={
+                "parent": composition_master,
+                "parenttype": "Alloy Chemical Composition Master",
+                "parentfield": "composition_rules",
+            },
+            fields=SPECTRO_RULE_FIELDS,
+            order_by="idx asc"
         )
         
-        if composition_master:
-            comp_doc = frappe.get_doc("Alloy Chemical Composition Master", composition_master)
+        for rule in rules:
+            condition_type = rule.condition_type
+            element_1 = rule.element_1
             
-            for rule in comp_doc.composition_rules or []:
-                condition_type = rule.condition_type
-                element_1 = rule.element_1
-                element_2 = rule.element_2
-                element_3 = rule.element_3
-                
-                # Build rule dict for building spec text
-                rule_dict = {
-                    "condition_type": condition_type,
-                    "limit_type": rule.limit_type,
-                    "min_percentage": rule.min_percentage,
-                    "max_percentage": rule.max_percentage,
+            spec_text, condition_text = build_spec_text(rule)
+            
+            if condition_type == "Sum Limit":
+                # Store sum rules separately for validation
+                sum_rules.append({
+                    "elements": _sum_element_codes(rule),
                     "sum_limit_type": rule.sum_limit_type,
-                    "sum_min_percentage": rule.sum_min_percentage,
-                    "sum_max_percentage": rule.sum_max_percentage,
-                    "remainder_min_percentage": rule.remainder_min_percentage,
-                    "ratio_value_1": rule.ratio_value_1,
-                    "ratio_value_2": rule.ratio_value_2,
-                    "ratio_value_3": rule.ratio_value_3,
-                    "notes": rule.notes,
-                    "element_1": element_1,
-                    "element_2": element_2,
-                    "element_3": element_3,
-                }
-                
-                spec_text, condition_text = build_spec_text(rule_dict)
-                
-                if condition_type == "Sum Limit":
-                    # Store sum rules separately for validation
-                    sum_elements = []
-                    if element_1:
-                        sum_elements.append(get_element_code_from_item(element_1))
-                    if element_2:
-                        sum_elements.append(get_element_code_from_item(element_2))
-                    if element_3:
-                        sum_elements.append(get_element_code_from_item(element_3))
-                    
-                    sum_rules.append({
-                        "elements": sum_elements,
-                        "sum_limit_type": rule.sum_limit_type,
-                        "sum_min": rule.sum_min_percentage,
-                        "sum_max": rule.sum_max_percentage,
-                        "label": condition_text
-                    })
-                else:
-                    # Normal element rule - add element_1 to elements list
-                    if element_1:
-                        code = get_element_code_from_item(element_1)
-                        if code and code not in element_codes_added:
-                            element_codes_added.add(code)
-                            elements.append({
-                                "code": code,
-                                "label": code,
-                                "spec_text": spec_text,
-                                "condition_text": condition_text,
-                                "condition_type": condition_type,
-                                "min_pct": rule.min_percentage,
-                                "max_pct": rule.max_percentage,
-                                "is_mandatory": rule.is_mandatory,
-                                "field_name": ELEMENT_FIELD_MAP.get(code, f"{code.lower()}_percent")
-                            })
+                    "sum_min": rule.sum_min_percentage,
+                    "sum_max": rule.sum_max_percentage,
+                    "label": condition_text
+                })
+            else:
+                # Normal element rule - add element_1 to elements list
+                if element_1:
+                    code = get_element_code_from_item(element_1)
+                    if code and code not in element_codes_added:
+                        element_codes_added.add(code)
+                        elements.append({
+                            "code": code,
+                            "label": code,
+                            "spec_text": spec_text,
+                            "condition_text": condition_text,
+                            "condition_type": condition_type,
+                            "min_pct": rule.min_percentage,
+                            "max_pct": rule.max_percentage,
+                            "is_mandatory": rule.is_mandatory,
+                            "field_name": ELEMENT_FIELD_MAP.get(code, f"{code.lower()}_percent")
+                        })
     
     # If no composition master found, use default elements
     if not elements:
@@ -1119,55 +1363,161 @@ def get_spectro_context(melting_batch):
                 "field_name": ELEMENT_FIELD_MAP.get(code, f"{code.lower()}_percent")
             })
     
-    # Sort elements by default order (known elements first, then others)
-    def element_sort_key(el):
-        code = el.get("code", "")
-        try:
-            return DEFAULT_ELEMENT_ORDER.index(code)
-        except ValueError:
-            return 100 + ord(code[0]) if code else 999
+    elements.sort(key=_element_sort_key)
+    return elements, sum_rules
+
+
+def _get_spectro_elements(composition_master, master_modified):
+    """
+    _build_spectro_elements through redis. The key carries the master's
+    modified timestamp, so editing the master starts a fresh entry.
+    """
+    if not composition_master:
+        return _build_spectro_elements(None)
+
+    cache_key = f"{SPECTRO_ELEMENTS_CACHE_PREFIX}:{composition_master}:{master_modified}"
+    cached = frappe.cache().get_value(cache_key)
+    if cached is not None:
+        return cached
+
+    layout = _build_spectro_elements(composition_master)
+    frappe.cache().set_value(cache_key, layout, expires_in_sec=SPECTRO_ELEMENTS_CACHE_TTL)
+    return layout
+
+
+def _get_spectro_state(melting_batch):
+    """
+    Batch header, active composition master and version of everything
+    get_spectro_context returns, in one query. Returns None if the batch
+    does not exist.
+
+    The version changes with the batch, its spectro samples and the
+    active composition master of its alloy.
+    """
+    row = frappe.db.sql("""
+        SELECT
+            b.modified,
+            b.alloy,
+            b.qc_status,
+            m.name AS composition_master,
+            m.modified AS master_modified,
+            (SELECT COUNT(*) FROM `tabMelting Batch Spectro Sample` s
+                WHERE s.parent = b.name AND s.parenttype = 'Melting Batch') AS sample_count,
+            (SELECT MAX(s.modified) FROM `tabMelting Batch Spectro Sample` s
+                WHERE s.parent = b.name AND s.parenttype = 'Melting Batch') AS samples_modified
+        FROM `tabMelting Batch` b
+        LEFT JOIN `tabAlloy Chemical Composition Master` m
+            ON m.name = (
+                SELECT m2.name FROM `tabAlloy Chemical Composition Master` m2
+                WHERE m2.alloy = b.alloy AND m2.is_active = 1
+                ORDER BY m2.modified DESC
+                LIMIT 1
+            )
+        WHERE b.name = %s
+    """, (melting_batch,), as_dict=True)
+    if not row:
+        return None
+
+    state = row[0]
+    parts = (
+        melting_batch, state.modified, state.alloy, state.qc_status, state.composition_master,
+        state.master_modified, state.sample_count, state.samples_modified,
+    )
+    state.version = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return state
+
+
+@frappe.whitelist()
+def get_spectro_context(melting_batch, client_version=None):
+    """
+    Return spectro sample context for a melting batch, including:
+    - elements: List of elements with spec from Alloy Chemical Composition Master
+    - samples: List of spectro samples with values mapped to element codes
+    - sum_rules: List of sum limit rules for validation
+    - version: pass back as client_version on the next poll; if nothing
+      changed the response is just {"unchanged": True, "version": ...}
     
-    elements.sort(key=element_sort_key)
+    This is used by the Melting Kiosk to render a dynamic spectro table.
+    """
+    if not melting_batch:
+        return {
+            "elements": [], "samples": [], "sum_rules": [], "alloy": None,
+            "composition_master": None, "qc_status": "Pending", "version": None,
+        }
     
-    # Build samples data
-    samples = []
-    for s in doc.spectro_samples or []:
-        values = {}
-        for el in elements:
-            code = el.get("code")
-            field_name = el.get("field_name")
-            if field_name and hasattr(s, field_name):
-                values[code] = getattr(s, field_name)
-            else:
-                values[code] = None
-        
-        samples.append({
+    # Batch header, composition master and version come from one query
+    doc = _get_spectro_state(melting_batch)
+    if not doc:
+        frappe.throw(_("Melting Batch {0} not found").format(melting_batch), frappe.DoesNotExistError)
+
+    version = doc.version
+    if client_version and client_version == version:
+        return {"unchanged": True, "version": version}
+    
+    alloy = doc.alloy
+    composition_master = doc.composition_master if alloy else None
+    master_modified = doc.master_modified if alloy else None
+    
+    elements, sum_rules = _get_spectro_elements(composition_master, master_modified)
+    
+    # Build samples data straight from the child table, with datetimes
+    # formatted in SQL; only element columns that exist are selected
+    sample_meta = frappe.get_meta("Melting Batch Spectro Sample")
+    field_pairs = tuple(
+        (el.get("code"), el.get("field_name") if sample_meta.has_field(el.get("field_name")) else None)
+        for el in elements
+    )
+    element_columns = "".join(
+        f", `{field_name}`" for field_name in {f for _code, f in field_pairs if f}
+    )
+    rows = frappe.db.sql(f"""
+        SELECT
+            name, sample_id,
+            DATE_FORMAT(sample_time, '%%Y-%%m-%%d %%H:%%i:%%s') AS sample_time,
+            status, overall_result, result_status, correction_required,
+            spec_master, remarks, qc_status, qc_comment, qc_deviation_summary,
+            qc_deviation_count, qc_deviation_detail, qc_last_updated_by,
+            DATE_FORMAT(qc_last_updated_on, '%%Y-%%m-%%d %%H:%%i:%%s') AS qc_last_updated_on
+            {element_columns}
+        FROM `tabMelting Batch Spectro Sample`
+        WHERE parent = %s AND parenttype = 'Melting Batch' AND parentfield = 'spectro_samples'
+        ORDER BY idx ASC
+    """, (melting_batch,), as_dict=True)
+
+    samples = [
+        {
             "name": s.name,
             "sample_id": s.sample_id,
-            "sample_time": str(s.sample_time) if s.sample_time else None,
-            "status": getattr(s, "status", None) or "Pending",  # New field
-            "overall_result": getattr(s, "overall_result", None) or "Pending",  # New field
+            "sample_time": s.sample_time,
+            "status": s.status or "Pending",
+            "overall_result": s.overall_result or "Pending",
             "result_status": s.result_status,  # Legacy field
             "correction_required": s.correction_required,
-            "spec_master": getattr(s, "spec_master", None),  # New field
+            "spec_master": s.spec_master,
             "remarks": s.remarks,
-            "qc_status": getattr(s, "qc_status", None) or "Pending",  # QC feedback fields
-            "qc_comment": getattr(s, "qc_comment", None) or "",
-            "qc_deviation_summary": getattr(s, "qc_deviation_summary", None) or "",
-            "qc_deviation_count": getattr(s, "qc_deviation_count", None) or 0,
-            "qc_deviation_detail": getattr(s, "qc_deviation_detail", None),  # Full deviation details (JSON)
-            "qc_last_updated_by": getattr(s, "qc_last_updated_by", None),
-            "qc_last_updated_on": str(getattr(s, "qc_last_updated_on", "")) if getattr(s, "qc_last_updated_on", None) else None,
-            "values": values
-        })
+            "qc_status": s.qc_status or "Pending",  # QC feedback fields
+            "qc_comment": s.qc_comment or "",
+            "qc_deviation_summary": s.qc_deviation_summary or "",
+            "qc_deviation_count": s.qc_deviation_count or 0,
+            "qc_deviation_detail": s.qc_deviation_detail,  # Full deviation details (JSON)
+            "qc_last_updated_by": s.qc_last_updated_by,
+            "qc_last_updated_on": s.qc_last_updated_on,
+            "values": {
+                code: s.get(field_name) if field_name else None
+                for code, field_name in field_pairs
+            },
+        }
+        for s in rows
+    ]
     
     return {
         "elements": elements,
         "samples": samples,
         "sum_rules": sum_rules,
         "alloy": alloy,
-        "composition_master": composition_master if alloy else None,
-        "qc_status": getattr(doc, "qc_status", None) or "Pending"  # Batch QC status
+        "composition_master": composition_master,
+        "qc_status": doc.qc_status or "Pending",  # Batch QC status
+        "version": version,
     }
 
 
@@ -1198,7 +1548,7 @@ def get_sample_qc_feedback(sample_name):
         frappe.throw(_("Sample not found: {0}").format(sample_name))
     
     # Get parent batch
-    batch = frappe.get_doc("Melting Batch", sample.parent)
+    batch = _get_batch(sample.parent)
     
     # Build sample_data dict with all actual element percentages
     sample_data = {}
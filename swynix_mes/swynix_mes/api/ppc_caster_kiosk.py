@@ -3,15 +3,116 @@
 
 import frappe
 from frappe import _
-from frappe.utils import getdate, get_datetime, now_datetime
+from frappe.utils import cint, getdate, get_datetime, now_datetime
 from frappe.utils.xlsxutils import make_xlsx
-from datetime import timedelta
+from bisect import bisect_right
+from datetime import datetime
+from operator import attrgetter
+from werkzeug.wrappers import Response
+from swynix_mes.swynix_mes.utils.workstation_cache import get_workstations
 
 # Status lists for scheduling logic
 # Plans that can still be shifted (not yet started)
 SHIFTABLE_STATUSES = ["Planned", "Released"]
 # Plans that are locked (already in production or completed)
 LOCKED_STATUSES = ["Melting", "Metal Ready", "Casting", "Coils Complete", "Not Produced"]
+# Set forms for in-memory membership checks; the lists stay for ORM/SQL filters
+SHIFTABLE_STATUSES_SET = frozenset(SHIFTABLE_STATUSES)
+LOCKED_STATUSES_SET = frozenset(LOCKED_STATUSES)
+# Every status except Not Produced, as a positive IN list the
+# (caster, status, start_datetime) index can range-scan
+DISPLAY_STATUSES = SHIFTABLE_STATUSES + [s for s in LOCKED_STATUSES if s != "Not Produced"]
+
+# Plan fields returned to the kiosk calendar (day, range and legacy range views)
+PLAN_CALENDAR_FIELDS = [
+	"name",
+	"plan_type",
+	"caster",
+	"furnace",
+	"start_datetime",
+	"end_datetime",
+	"duration_minutes",
+	"melting_start",
+	"melting_end",
+	"casting_start",
+	"casting_end",
+	"actual_start",
+	"actual_end",
+	"product_item",
+	"alloy",
+	"temper",
+	"customer",
+	"planned_width_mm",
+	"planned_gauge_mm",
+	"planned_weight_mt",
+	"final_width_mm",
+	"final_gauge_mm",
+	"final_weight_mt",
+	"charge_mix_recipe",
+	"downtime_type",
+	"downtime_reason",
+	"status",
+	"remarks",
+	"melting_batch",
+	"mother_coil",
+	"overlap_flag",
+	"overlap_note",
+]
+
+# Slim field set for calendar event blocks and their tooltips
+PLAN_EVENT_FIELDS = [
+	"name",
+	"plan_type",
+	"furnace",
+	"start_datetime",
+	"end_datetime",
+	"melting_start",
+	"melting_end",
+	"casting_start",
+	"casting_end",
+	"actual_start",
+	"actual_end",
+	"product_item",
+	"alloy",
+	"temper",
+	"customer",
+	"planned_weight_mt",
+	"downtime_type",
+	"status",
+	"overlap_flag",
+	"overlap_note",
+]
+
+# Field sets selectable through get_plan_for_range(view=...)
+PLAN_FIELDSETS = {
+	"event": PLAN_EVENT_FIELDS,
+	"full": PLAN_CALENDAR_FIELDS,
+}
+
+# Upper bound on plans returned for one range request
+MAX_PLANS_PER_RANGE = 5000
+
+# Optional kiosk dialog fields copied onto a new plan by create_plan
+PLAN_OPTIONAL_FIELDS = ("furnace", "remarks")
+PLAN_TYPE_FIELDS = {
+	"Casting": (
+		"product_item", "alloy", "temper", "customer",
+		"planned_width_mm", "planned_gauge_mm", "planned_weight_mt",
+		"final_width_mm", "final_gauge_mm", "final_weight_mt",
+		"charge_mix_recipe",
+	),
+	"Downtime": ("downtime_type", "downtime_reason"),
+}
+
+
+def _as_datetime(value):
+	"""get_datetime(), skipped for values that already are datetimes."""
+	return value if isinstance(value, datetime) else get_datetime(value)
+
+
+def _format_datetime(value):
+	"""Plain 'YYYY-MM-DD HH:MM:SS' text for error messages."""
+	return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
 
 
 def ensure_not_in_past(start_dt, label="plan"):
@@ -24,15 +125,15 @@ def ensure_not_in_past(start_dt, label="plan"):
 
 	now = now_datetime()
 	# Convert to comparable datetime
-	start_dt = get_datetime(start_dt)
+	start_dt = _as_datetime(start_dt)
 
 	if start_dt < now:
 		frappe.throw(
 			_("Cannot schedule this {0} in the past. "
 			  "Start time {1} is earlier than current time {2}.").format(
 				label,
-				frappe.format(start_dt, {"fieldtype": "Datetime"}),
-				frappe.format(now, {"fieldtype": "Datetime"})
+				_format_datetime(start_dt),
+				_format_datetime(now)
 			)
 		)
 
@@ -54,8 +155,8 @@ def compute_shift_window_and_delta(caster, new_start, new_end):
 	if not caster or not (new_start and new_end):
 		return None, 0
 
-	new_start = get_datetime(new_start)
-	new_end = get_datetime(new_end)
+	new_start = _as_datetime(new_start)
+	new_end = _as_datetime(new_end)
 
 	# Get earliest shiftable plan starting at/after new_start
 	first_future = frappe.db.get_value(
@@ -64,6 +165,7 @@ def compute_shift_window_and_delta(caster, new_start, new_end):
 			"caster": caster,
 			"status": ["in", SHIFTABLE_STATUSES],
 			"start_datetime": [">=", new_start],
+			"docstatus": ["<", 2],  # cancelled plans keep their status
 		},
 		"start_datetime",
 		order_by="start_datetime asc",
@@ -72,7 +174,7 @@ def compute_shift_window_and_delta(caster, new_start, new_end):
 	if not first_future:
 		return None, 0
 
-	first_future = get_datetime(first_future)
+	first_future = _as_datetime(first_future)
 	delta = (new_end - first_future).total_seconds()
 
 	if delta <= 0:
@@ -83,6 +185,48 @@ def compute_shift_window_and_delta(caster, new_start, new_end):
 	return first_future, int(delta)
 
 
+def _compute_shift_from_list(plans, new_start, new_end):
+	"""
+	compute_shift_window_and_delta over an already-fetched plan list
+	(ordered by start_datetime). Returns (shift_from, delta_seconds).
+	"""
+	first_future = next(
+		(
+			p.start_datetime for p in plans
+			if p.status in SHIFTABLE_STATUSES_SET and p.start_datetime >= new_start
+		),
+		None,
+	)
+	if not first_future:
+		return None, 0
+
+	delta = (new_end - first_future).total_seconds()
+	if delta <= 0:
+		# New plan ends before or exactly at first_future_start
+		return None, 0
+
+	return first_future, int(delta)
+
+
+def _find_overlap_index(plans, at):
+	"""
+	Index of the plan in `plans` (ordered by start_datetime) whose
+	[start, end) contains `at`, or None. Works on the fetched rows directly
+	so bulk callers can reuse one fetch for many lookups.
+
+	Plans on a caster can overlap (check_caster_overlap allows a later
+	shiftable plan to start inside an earlier one), so any plan starting
+	at/before `at` may contain it. Binary search bounds the scan to those
+	plans, which are checked in start order so the earliest containing plan
+	wins, as in a full linear scan.
+	"""
+	stop = bisect_right(plans, at, key=attrgetter("start_datetime"))
+	for idx in range(stop):
+		if at < plans[idx].end_datetime:
+			return idx
+	return None
+
+
 def shift_future_plans(caster, from_datetime, delta_seconds, exclude_name=None):
 	"""
 	Shift all *shiftable* PPC Casting Plans for a caster that start on/after `from_datetime`
@@ -94,42 +238,50 @@ def shift_future_plans(caster, from_datetime, delta_seconds, exclude_name=None):
 	  to preserve the original plan duration.
 
 	This is a "dumb shifter" - the smart logic lives in compute_shift_window_and_delta().
+
+	Does not commit; the shift is committed together with the caller's
+	changes (the whitelisted request commits on success).
 	"""
 	if not caster or not delta_seconds or not from_datetime:
 		return
 
-	delta = timedelta(seconds=int(delta_seconds))
-
-	future_plans = frappe.get_all(
-		"PPC Casting Plan",
-		filters={
+	delta_seconds = int(delta_seconds)
+
+	# ✅ Preserve duration: shift both start and end by the same delta,
+	# for all matching plans in one UPDATE
+	frappe.db.sql(
+		"""
+		UPDATE `tabPPC Casting Plan`
+		SET start_datetime = DATE_ADD(start_datetime, INTERVAL %(delta)s SECOND),
+			end_datetime = DATE_ADD(end_datetime, INTERVAL %(delta)s SECOND),
+			modified = %(modified)s,
+			modified_by = %(user)s
+		WHERE caster = %(caster)s
+			AND status IN %(statuses)s
+			AND docstatus < 2
+			AND start_datetime >= %(from_datetime)s
+			AND name != %(exclude_name)s
+		""",
+		{
+			"delta": delta_seconds,
+			"modified": now_datetime(),
+			"user": frappe.session.user,
 			"caster": caster,
-			"status": ["in", SHIFTABLE_STATUSES],  # Only not-started plans
-			"start_datetime": [">=", from_datetime],
+			"statuses": tuple(SHIFTABLE_STATUSES),  # Only not-started plans
+			"from_datetime": _as_datetime(from_datetime),
+			"exclude_name": exclude_name or "",
 		},
-		fields=["name", "start_datetime", "end_datetime"],
-		order_by="start_datetime asc",
 	)
 
-	for p in future_plans:
-		if exclude_name and p.name == exclude_name:
-			continue
 
-		# ✅ Preserve duration: shift both start and end by the same delta
-		new_start = p.start_datetime + delta  # old_start + delta
-		new_end = p.end_datetime + delta      # old_end + delta (NOT recalculated!)
-
-		frappe.db.set_value(
-			"PPC Casting Plan",
-			p.name,
-			{
-				"start_datetime": new_start,
-				"end_datetime": new_end,
-			},
-			update_modified=True,
-		)
+def lock_caster_schedule(caster):
+	"""
+	Take a row lock on the caster's Workstation for the rest of the transaction.
 
-	frappe.db.commit()
+	Locking the Workstation rather than the caster's plans also covers the
+	case where the caster has no future plans yet (nothing to lock).
+	"""
+	frappe.db.get_value("Workstation", caster, "name", for_update=True)
 
 
 def ensure_no_overlap_with_locked(caster, start_dt, end_dt, exclude_name=None):
@@ -142,34 +294,45 @@ def ensure_no_overlap_with_locked(caster, start_dt, end_dt, exclude_name=None):
 	if not caster or not (start_dt and end_dt):
 		return
 
-	overlap = frappe.get_all(
-		"PPC Casting Plan",
-		filters={
+	start_dt = _as_datetime(start_dt)
+	end_dt = _as_datetime(end_dt)
+
+	# (start < other_end) and (end > other_start) => overlap.
+	# LIMIT 1 lets MySQL stop at the first hit; the row carries what the
+	# error message needs, so no second fetch is required on conflict.
+	overlap = frappe.db.sql(
+		"""
+		SELECT name, start_datetime, end_datetime, status
+		FROM `tabPPC Casting Plan`
+		WHERE caster = %(caster)s
+			AND status IN %(statuses)s
+			AND docstatus < 2
+			AND start_datetime < %(end)s
+			AND end_datetime > %(start)s
+			AND name != %(exclude_name)s
+		LIMIT 1
+		""",
+		{
 			"caster": caster,
-			"status": ["in", LOCKED_STATUSES],
-			"docstatus": ["<", 2],  # Not cancelled
+			"statuses": tuple(LOCKED_STATUSES),
+			"start": start_dt,
+			"end": end_dt,
+			"exclude_name": exclude_name or "",
 		},
-		fields=["name", "start_datetime", "end_datetime", "status"],
+		as_dict=True,
 	)
 
-	for p in overlap:
-		if exclude_name and p.name == exclude_name:
-			continue
-
-		s = p.start_datetime
-		e = p.end_datetime
-
-		# (start < other_end) and (end > other_start) => overlap
-		if start_dt < e and end_dt > s:
-			frappe.throw(
-				_("Cannot schedule in this time slot. It overlaps locked plan <b>{0}</b> "
-				  "({1} → {2}) which is {3}.").format(
-					p.name,
-					frappe.format(p.start_datetime, {"fieldtype": "Datetime"}),
-					frappe.format(p.end_datetime, {"fieldtype": "Datetime"}),
-					p.status
-				)
+	if overlap:
+		p = overlap[0]
+		frappe.throw(
+			_("Cannot schedule in this time slot. It overlaps locked plan <b>{0}</b> "
+			  "({1} → {2}) which is {3}.").format(
+				p.name,
+				_format_datetime(p.start_datetime),
+				_format_datetime(p.end_datetime),
+				p.status
 			)
+		)
 
 
 @frappe.whitelist()
@@ -203,10 +366,18 @@ def preview_plan_insertion(caster, start_datetime, end_datetime):
 		"PPC Casting Plan",
 		filters={
 			"caster": caster,
-			"status": ["not in", ["Not Produced"]],
+			"status": ["in", DISPLAY_STATUSES],
 			"docstatus": ["<", 2],
 		},
-		fields=["name", "start_datetime", "end_datetime", "status"],
+		fields=[
+			"name",
+			"plan_type",
+			"start_datetime",
+			"end_datetime",
+			"product_item",
+			"downtime_type",
+			"status",
+		],
 		order_by="start_datetime asc",
 	)
 
@@ -214,11 +385,7 @@ def preview_plan_insertion(caster, start_datetime, end_datetime):
 	suggested_end = req_end
 
 	# 1) Find if requested start lies INSIDE any existing plan
-	overlapped_index = None
-	for idx, p in enumerate(plans):
-		if p.start_datetime <= req_start < p.end_datetime:
-			overlapped_index = idx
-			break
+	overlapped_index = _find_overlap_index(plans, req_start)
 
 	if overlapped_index is not None:
 		# New request falls inside some existing plan
@@ -256,34 +423,16 @@ def preview_plan_insertion(caster, start_datetime, end_datetime):
 	# 2) Ensure we don't overlap LOCKED plans with the suggested slot
 	ensure_no_overlap_with_locked(caster, suggested_start, suggested_end, exclude_name=None)
 
-	# 3) Compute where shift will start & by how much (smart delta calculation)
-	shift_from, delta_seconds = compute_shift_window_and_delta(
-		caster=caster,
-		new_start=suggested_start,
-		new_end=suggested_end,
-	)
+	# 3) Compute where shift will start & by how much (smart delta calculation),
+	# from the plans already fetched above
+	shift_from, delta_seconds = _compute_shift_from_list(plans, suggested_start, suggested_end)
 
 	# 4) Compute affected plans = shiftable plans starting at/after shift_from
 	if shift_from and delta_seconds > 0:
-		affected = frappe.get_all(
-			"PPC Casting Plan",
-			filters={
-				"caster": caster,
-				"status": ["in", SHIFTABLE_STATUSES],
-				"docstatus": ["<", 2],
-				"start_datetime": [">=", shift_from],
-			},
-			fields=[
-				"name",
-				"plan_type",
-				"start_datetime",
-				"end_datetime",
-				"product_item",
-				"downtime_type",
-				"status",
-			],
-			order_by="start_datetime asc",
-		)
+		affected = [
+			p for p in plans
+			if p.status in SHIFTABLE_STATUSES_SET and p.start_datetime >= shift_from
+		]
 	else:
 		affected = []
 
@@ -301,23 +450,13 @@ def preview_plan_insertion(caster, start_datetime, end_datetime):
 @frappe.whitelist()
 def get_casters():
 	"""Get all Workstations with workstation_type = 'Casting'"""
-	return frappe.get_all(
-		"Workstation",
-		filters={"workstation_type": "Casting"},
-		fields=["name", "workstation_name"],
-		order_by="name asc"
-	)
+	return get_workstations("Casting")
 
 
 @frappe.whitelist()
 def get_furnaces():
 	"""Get all Workstations with workstation_type = 'Foundry'"""
-	return frappe.get_all(
-		"Workstation",
-		filters={"workstation_type": "Foundry"},
-		fields=["name", "workstation_name"],
-		order_by="name asc"
-	)
+	return get_workstations("Foundry")
 
 
 @frappe.whitelist()
@@ -333,32 +472,41 @@ def check_caster_plan_impact(caster, start_datetime):
 
 	start_dt = get_datetime(start_datetime)
 
-	plans = frappe.get_all(
-		"PPC Casting Plan",
-		filters={
-			"caster": caster,
-			"status": ["in", SHIFTABLE_STATUSES],  # Only not-started plans
-			"docstatus": ["<", 2],
-			"start_datetime": [">=", start_dt],
-		},
-		fields=[
-			"name",
-			"plan_type",
-			"start_datetime",
-			"end_datetime",
-			"product_item",
-			"downtime_type",
-			"status",
-		],
-		order_by="start_datetime asc",
+	# product_item only applies to Casting rows and downtime_type only to
+	# Downtime rows, so they are returned as a single label column
+	plans = frappe.db.sql(
+		"""
+		SELECT
+			name, plan_type, start_datetime, end_datetime, status,
+			CASE WHEN plan_type = 'Downtime' THEN downtime_type ELSE product_item END AS label
+		FROM `tabPPC Casting Plan`
+		WHERE caster = %(caster)s
+			AND status IN %(statuses)s
+			AND docstatus < 2
+			AND start_datetime >= %(start)s
+		ORDER BY start_datetime ASC
+		""",
+		{"caster": caster, "statuses": tuple(SHIFTABLE_STATUSES), "start": start_dt},
+		as_dict=True,
 	)
 
 	return plans
 
 
+def _get_plan_fieldset(view):
+	"""Fields for a PLAN_FIELDSETS view name; throws on an unknown view."""
+	fields = PLAN_FIELDSETS.get(view)
+	if fields is None:
+		frappe.throw(_("Unknown view: {0}").format(view))
+	return fields
+
+
 @frappe.whitelist()
-def get_plans_for_day(caster, date):
-	"""Get all PPC Casting Plans for a given caster and date"""
+def get_plans_for_day(caster, date, view="full"):
+	"""
+	Get all PPC Casting Plans for a given caster and date.
+	view selects the field set, as in get_plan_for_range.
+	"""
 	if not caster or not date:
 		return []
 
@@ -367,48 +515,16 @@ def get_plans_for_day(caster, date):
 		filters={
 			"caster": caster,
 			"plan_date": date,
-			"status": ["not in", ["Not Produced"]],
+			"status": ["in", DISPLAY_STATUSES],
 			"docstatus": ["<", 2]  # Not cancelled
 		},
-		fields=[
-			"name",
-			"plan_type",
-			"start_datetime",
-			"end_datetime",
-			"duration_minutes",
-			"melting_start",
-			"melting_end",
-			"casting_start",
-			"casting_end",
-			"actual_start",
-			"actual_end",
-			"product_item",
-			"alloy",
-			"temper",
-			"customer",
-			"planned_width_mm",
-			"planned_gauge_mm",
-			"planned_weight_mt",
-			"final_width_mm",
-			"final_gauge_mm",
-			"final_weight_mt",
-			"charge_mix_recipe",
-			"status",
-			"downtime_type",
-			"downtime_reason",
-			"remarks",
-			"furnace",
-			"melting_batch",
-			"mother_coil",
-			"overlap_flag",
-			"overlap_note"
-		],
+		fields=_get_plan_fieldset(view),
 		order_by="start_datetime asc"
 	)
 
 
 @frappe.whitelist()
-def get_plan_for_range(caster, start, end):
+def get_plan_for_range(caster, start, end, view="full"):
 	"""
 	Return PPC Casting Plans for a given caster between start and end (ISO datetimes).
 	Used by FullCalendar to fetch events for the visible range.
@@ -420,10 +536,15 @@ def get_plan_for_range(caster, start, end):
 	
 	Note: planned_duration_minutes is an internal field used by scheduling logic,
 	not exposed in this API as it's not needed for calendar display.
+
+	view="event" returns only the fields the calendar renders; "full"
+	(default) returns PLAN_CALENDAR_FIELDS.
 	"""
 	if not caster:
 		return []
 
+	fields = _get_plan_fieldset(view)
+
 	plans = frappe.get_all(
 		"PPC Casting Plan",
 		filters={
@@ -431,44 +552,19 @@ def get_plan_for_range(caster, start, end):
 			# Overlap detection: event starts before view ends AND event ends after view starts
 			"start_datetime": ["<", end],
 			"end_datetime": [">", start],
-			"status": ["not in", ["Not Produced"]],
+			"status": ["in", DISPLAY_STATUSES],
 			"docstatus": ["<", 2]  # Not cancelled
 		},
-		fields=[
-			"name",
-			"plan_type",
-			"caster",
-			"furnace",
-			"start_datetime",
-			"end_datetime",
-			"duration_minutes",
-			"melting_start",
-			"melting_end",
-			"casting_start",
-			"casting_end",
-			"actual_start",
-			"actual_end",
-			"product_item",
-			"alloy",
-			"temper",
-			"customer",
-			"planned_width_mm",
-			"planned_gauge_mm",
-			"planned_weight_mt",
-			"final_width_mm",
-			"final_gauge_mm",
-			"final_weight_mt",
-			"charge_mix_recipe",
-			"downtime_type",
-			"status",
-			"remarks",
-			"melting_batch",
-			"mother_coil",
-			"overlap_flag",
-			"overlap_note"
-		],
+		fields=fields,
 		order_by="start_datetime asc",
+		limit=MAX_PLANS_PER_RANGE + 1,
 	)
+	if len(plans) > MAX_PLANS_PER_RANGE:
+		frappe.throw(
+			_("More than {0} plans in the selected range. Please choose a shorter range.").format(
+				MAX_PLANS_PER_RANGE
+			)
+		)
 	return plans
 
 
@@ -483,43 +579,10 @@ def get_plans_for_range(caster, from_date, to_date):
 		filters={
 			"caster": caster,
 			"plan_date": ["between", [from_date, to_date]],
-			"status": ["not in", ["Not Produced"]],
+			"status": ["in", DISPLAY_STATUSES],
 			"docstatus": ["<", 2]
 		},
-		fields=[
-			"name",
-			"plan_type",
-			"plan_date",
-			"start_datetime",
-			"end_datetime",
-			"duration_minutes",
-			"melting_start",
-			"melting_end",
-			"casting_start",
-			"casting_end",
-			"actual_start",
-			"actual_end",
-			"product_item",
-			"alloy",
-			"temper",
-			"customer",
-			"planned_width_mm",
-			"planned_gauge_mm",
-			"planned_weight_mt",
-			"final_width_mm",
-			"final_gauge_mm",
-			"final_weight_mt",
-			"charge_mix_recipe",
-			"status",
-			"downtime_type",
-			"downtime_reason",
-			"remarks",
-			"furnace",
-			"melting_batch",
-			"mother_coil",
-			"overlap_flag",
-			"overlap_note"
-		],
+		fields=[*PLAN_CALENDAR_FIELDS, "plan_date"],
 		order_by="start_datetime asc"
 	)
 
@@ -531,11 +594,8 @@ def create_plan(data):
 	- Only shifts not-started future plans (SHIFTABLE_STATUSES).
 	- Never overlaps locked plans.
 	"""
-	if isinstance(data, str):
-		import json
-		data = json.loads(data)
-
-	data = frappe._dict(data)
+	# JSON string from frappe.call or dict from server-side callers
+	data = frappe._dict(frappe.parse_json(data))
 
 	# Required field validation
 	if not data.caster:
@@ -560,8 +620,14 @@ def create_plan(data):
 	# 🚫 No planning in the past
 	ensure_not_in_past(start_dt, label="plan")
 
-	# 1) Ensure we don't overlap any locked plan
-	ensure_no_overlap_with_locked(data.caster, start_dt, end_dt, exclude_name=None)
+	# Serialize concurrent creates on this caster until the request commits,
+	# so the shift and insert below see one consistent schedule
+	lock_caster_schedule(data.caster)
+
+	# 1) Locked plans: the kiosk sends times already checked by
+	# preview_plan_insertion, and check_caster_overlap re-runs the same
+	# locked-plan query when the doc is inserted. If that fails, the request
+	# rolls back the shift from step 3 too, so no separate pre-check here.
 
 	# 2) Compute smart shift window & amount
 	# This finds the first shiftable plan >= start_dt and computes
@@ -590,55 +656,17 @@ def create_plan(data):
 	doc.start_datetime = start_dt
 	doc.end_datetime = end_dt
 
-	# derive plan_date from start_datetime if not provided
-	if not doc.plan_date and doc.start_datetime:
-		doc.plan_date = getdate(doc.start_datetime)
+	# derive plan_date from start_datetime (already a datetime, no re-parse)
+	doc.plan_date = start_dt.date()
 
 	doc.status = "Planned"
 
-	# Optional common fields
-	if data.furnace:
-		doc.furnace = data.furnace
-	if data.remarks:
-		doc.remarks = data.remarks
-
-	# Casting-specific fields
-	if data.plan_type == "Casting":
-		if data.product_item:
-			doc.product_item = data.product_item
-		if data.alloy:
-			doc.alloy = data.alloy
-		if data.temper:
-			doc.temper = data.temper
-		if data.customer:
-			doc.customer = data.customer
-
-		# Planned parameters
-		if data.planned_width_mm:
-			doc.planned_width_mm = data.planned_width_mm
-		if data.planned_gauge_mm:
-			doc.planned_gauge_mm = data.planned_gauge_mm
-		if data.planned_weight_mt:
-			doc.planned_weight_mt = data.planned_weight_mt
-
-		# Final parameters (optional)
-		if data.final_width_mm:
-			doc.final_width_mm = data.final_width_mm
-		if data.final_gauge_mm:
-			doc.final_gauge_mm = data.final_gauge_mm
-		if data.final_weight_mt:
-			doc.final_weight_mt = data.final_weight_mt
-
-		# Charge mix recipe
-		if data.charge_mix_recipe:
-			doc.charge_mix_recipe = data.charge_mix_recipe
-
-	# Downtime-specific fields
-	elif data.plan_type == "Downtime":
-		if data.downtime_type:
-			doc.downtime_type = data.downtime_type
-		if data.downtime_reason:
-			doc.downtime_reason = data.downtime_reason
+	# Optional fields, copied only when the dialog sent a value
+	optional_fields = PLAN_OPTIONAL_FIELDS + PLAN_TYPE_FIELDS.get(data.plan_type, ())
+	for fieldname in optional_fields:
+		value = data.get(fieldname)
+		if value:
+			doc.set(fieldname, value)
 
 	# Insert (validates via controller, but overlap check will now skip shiftable plans)
 	doc.insert()
@@ -650,8 +678,13 @@ def create_plan(data):
 
 
 @frappe.whitelist()
-def update_plan_times(plan_name, start_datetime, end_datetime):
-	"""Update start and end times for a plan (for drag-drop functionality)"""
+def update_plan_times(plan_name, start_datetime, end_datetime, amend=0):
+	"""
+	Update start and end times for a plan (for drag-drop functionality).
+
+	Submitted plans are moved in place. Pass amend=1 to cancel and amend
+	instead, when a new version of the plan is needed.
+	"""
 	if not plan_name:
 		frappe.throw(_("Plan name is required"))
 
@@ -661,7 +694,7 @@ def update_plan_times(plan_name, start_datetime, end_datetime):
 	if doc.docstatus == 2:
 		frappe.throw(_("Cannot modify cancelled plan"))
 
-	if doc.status in LOCKED_STATUSES:
+	if doc.status in LOCKED_STATUSES_SET:
 		frappe.throw(_("Cannot modify plan in status: {0}").format(doc.status))
 
 	# Validate new times
@@ -674,20 +707,47 @@ def update_plan_times(plan_name, start_datetime, end_datetime):
 	# 🚫 Don't allow dragging plans into the past
 	ensure_not_in_past(new_start_dt, label="plan")
 
-	# If submitted, need to amend
-	if doc.docstatus == 1:
+	# A drop back onto the same slot changes nothing; skip the writes
+	if (
+		not cint(amend)
+		and _as_datetime(doc.start_datetime) == new_start_dt
+		and _as_datetime(doc.end_datetime) == new_end_dt
+	):
+		return doc.name
+
+	if doc.docstatus == 1 and not cint(amend) and doc.status in SHIFTABLE_STATUSES_SET:
+		# Only the times change: run the controller's time checks and write
+		# the affected columns instead of cancel + amend + submit. db_set
+		# checks no permissions, so require what amending would have needed.
+		doc.check_permission("write")
+		doc.check_permission("submit")
+		doc.start_datetime = new_start_dt
+		doc.end_datetime = new_end_dt
+		doc.calculate_duration()
+		doc.set_planned_duration()
+		doc.check_caster_overlap()
+		doc.db_set(
+			{
+				"start_datetime": doc.start_datetime,
+				"end_datetime": doc.end_datetime,
+				"duration_minutes": doc.duration_minutes,
+				"planned_duration_minutes": doc.planned_duration_minutes,
+			},
+			update_modified=True,
+		)
+	elif doc.docstatus == 1:
 		# Cancel and amend
 		doc.cancel()
 		doc = frappe.copy_doc(doc)
 		doc.amended_from = plan_name
-		doc.start_datetime = start_datetime
-		doc.end_datetime = end_datetime
+		doc.start_datetime = new_start_dt
+		doc.end_datetime = new_end_dt
 		doc.insert()
 		doc.submit()
 	else:
 		# Just update
-		doc.start_datetime = start_datetime
-		doc.end_datetime = end_datetime
+		doc.start_datetime = new_start_dt
+		doc.end_datetime = new_end_dt
 		doc.save()
 
 	return doc.name
@@ -699,16 +759,21 @@ def cancel_plan(plan_name):
 	if not plan_name:
 		frappe.throw(_("Plan name is required"))
 
-	doc = frappe.get_doc("PPC Casting Plan", plan_name)
+	plan = frappe.db.get_value(
+		"PPC Casting Plan", plan_name, ["docstatus", "status"], as_dict=True, for_update=True
+	)
+	if not plan:
+		frappe.throw(_("PPC Casting Plan {0} not found").format(plan_name), frappe.DoesNotExistError)
 
-	if doc.docstatus == 2:
+	if plan.docstatus == 2:
 		frappe.throw(_("Plan is already cancelled"))
 
-	if doc.docstatus == 1:
-		doc.cancel()
+	if plan.docstatus == 1:
+		# Submitted plans go through the full cancel lifecycle (on_cancel hooks)
+		frappe.get_doc("PPC Casting Plan", plan_name).cancel()
 	else:
-		doc.status = "Not Produced"
-		doc.save()
+		frappe.has_permission("PPC Casting Plan", "write", plan_name, throw=True)
+		frappe.db.set_value("PPC Casting Plan", plan_name, "status", "Not Produced", update_modified=True)
 
 	return {"message": "Plan cancelled successfully"}
 
@@ -719,115 +784,231 @@ def release_plan(plan_name):
 	if not plan_name:
 		frappe.throw(_("Plan name is required"))
 
-	doc = frappe.get_doc("PPC Casting Plan", plan_name)
+	# Read and update the status only; no need to load the whole plan
+	status = frappe.db.get_value("PPC Casting Plan", plan_name, "status", for_update=True)
+	if status is None:
+		frappe.throw(_("PPC Casting Plan {0} not found").format(plan_name), frappe.DoesNotExistError)
 
-	if doc.status != "Planned":
-		frappe.throw(_("Only Planned plans can be released. Current status: {0}").format(doc.status))
+	if status != "Planned":
+		frappe.throw(_("Only Planned plans can be released. Current status: {0}").format(status))
+
+	frappe.db.set_value("PPC Casting Plan", plan_name, "status", "Released", update_modified=True)
 
-	doc.db_set("status", "Released", update_modified=True)
-	
 	return {"message": "Plan released for melting", "status": "Released"}
 
 
+# Header row of the plan export, in the column order of _get_export_rows
+PLAN_EXPORT_COLUMNS = [
+	"Name",
+	"Plan Type",
+	"Caster",
+	"Status",
+	"Start Datetime",
+	"End Datetime",
+	"Actual Start",
+	"Actual End",
+	"Product Item",
+	"Alloy",
+	"Temper",
+	"Customer",
+	"Planned Width (mm)",
+	"Planned Gauge (mm)",
+	"Planned Weight (MT)",
+	"Final Width (mm)",
+	"Final Gauge (mm)",
+	"Final Weight (MT)",
+	"Charge Mix Recipe",
+	"Downtime Type",
+	"Melting Batch",
+	"Mother Coil",
+	"Remarks",
+]
+
+CSV_EXPORT_CHUNK_ROWS = 500
+
+# Exports spanning at least this many days are built in a background job;
+# a calendar month view (at most 31 days) is still downloaded directly
+EXPORT_ASYNC_MIN_DAYS = 32
+
+
+def _csv_cell(value):
+	"""CSV text for an export value: '' for None, seconds precision for datetimes."""
+	if value is None:
+		return ""
+	if isinstance(value, datetime):
+		return _format_datetime(value)
+	return str(value)
+
+
+def _iter_csv_chunks(rows):
+	"""Encode rows as CSV, yielding UTF-8 chunks of CSV_EXPORT_CHUNK_ROWS rows."""
+	import csv
+	import io
+
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+	for i, row in enumerate(rows, 1):
+		writer.writerow([_csv_cell(cell) for cell in row])
+		if i % CSV_EXPORT_CHUNK_ROWS == 0:
+			yield buffer.getvalue().encode("utf-8")
+			buffer.seek(0)
+			buffer.truncate()
+
+	if buffer.tell():
+		yield buffer.getvalue().encode("utf-8")
+
+
+def _get_export_rows(caster, start, end):
+	"""
+	Header + plan rows for the export, or None when there are no plans.
+
+	Rows are produced lazily so neither writer needs a full copy.
+	"""
+	# Same overlap filter as get_plan_for_range, selected straight into the
+	# export column order so each tuple is already a file row
+	plans = frappe.db.sql(
+		"""
+		SELECT
+			name, plan_type, caster, status,
+			start_datetime, end_datetime, actual_start, actual_end,
+			product_item, alloy, temper, customer,
+			planned_width_mm, planned_gauge_mm, planned_weight_mt,
+			final_width_mm, final_gauge_mm, final_weight_mt,
+			charge_mix_recipe, downtime_type, melting_batch, mother_coil, remarks
+		FROM `tabPPC Casting Plan`
+		WHERE caster = %(caster)s
+			AND start_datetime < %(end)s
+			AND end_datetime > %(start)s
+			AND status IN %(statuses)s
+			AND docstatus < 2
+		ORDER BY start_datetime ASC
+		""",
+		{"caster": caster, "start": start, "end": end, "statuses": tuple(DISPLAY_STATUSES)},
+	)
+	if not plans:
+		return None
+
+	def iter_rows():
+		yield PLAN_EXPORT_COLUMNS
+		yield from plans
+
+	return iter_rows()
+
+
+def _get_export_file_name(caster, start, end, format):
+	return f"PPC-Casting-Plan-{caster}-{start[:10]}-to-{end[:10]}.{format}"
+
+
 @frappe.whitelist()
-def export_plans(caster, start, end, format="xlsx"):
+def export_plans(caster, start, end, format="xlsx", enqueue_only=0):
 	"""
 	Export PPC Casting Plans for a given caster and date range.
 	Supports both Excel (.xlsx) and CSV formats.
 	Sets response to download the file directly.
+
+	Ranges of EXPORT_ASYNC_MIN_DAYS or more are built in a background job
+	instead; the call returns {"queued": True} and the user gets a
+	"ppc_plan_export_ready" realtime event with the file URL.
+
+	With enqueue_only=1 the file is never built in the request: smaller
+	ranges are checked as the download would check them and return
+	{"queued": False} so the caller can download them directly, and the
+	threshold stays on the server.
 	"""
 	if not caster:
 		frappe.throw(_("Caster is required for export."))
 
-	plans = get_plan_for_range(caster, start, end)
-	if not plans:
+	if format != "csv":
+		format = "xlsx"
+
+	if (getdate(end) - getdate(start)).days >= EXPORT_ASYNC_MIN_DAYS:
+		frappe.enqueue(
+			"swynix_mes.swynix_mes.api.ppc_caster_kiosk.export_plans_async",
+			queue="long",
+			caster=caster,
+			start=start,
+			end=end,
+			format=format,
+		)
+		return {"queued": True}
+
+	rows = _get_export_rows(caster, start, end)
+	if rows is None:
 		frappe.throw(_("No plans found for the selected period."))
 
-	# Prepare data: header + rows
-	columns = [
-		"Name",
-		"Plan Type",
-		"Caster",
-		"Status",
-		"Start Datetime",
-		"End Datetime",
-		"Actual Start",
-		"Actual End",
-		"Product Item",
-		"Alloy",
-		"Temper",
-		"Customer",
-		"Planned Width (mm)",
-		"Planned Gauge (mm)",
-		"Planned Weight (MT)",
-		"Final Width (mm)",
-		"Final Gauge (mm)",
-		"Final Weight (MT)",
-		"Charge Mix Recipe",
-		"Downtime Type",
-		"Melting Batch",
-		"Mother Coil",
-		"Remarks",
-	]
-	data = [columns]
-
-	for p in plans:
-		row = [
-			p.get("name"),
-			p.get("plan_type"),
-			p.get("caster") or caster,
-			p.get("status"),
-			str(p.get("start_datetime") or ""),
-			str(p.get("end_datetime") or ""),
-			str(p.get("actual_start") or ""),
-			str(p.get("actual_end") or ""),
-			p.get("product_item"),
-			p.get("alloy"),
-			p.get("temper"),
-			p.get("customer"),
-			p.get("planned_width_mm"),
-			p.get("planned_gauge_mm"),
-			p.get("planned_weight_mt"),
-			p.get("final_width_mm"),
-			p.get("final_gauge_mm"),
-			p.get("final_weight_mt"),
-			p.get("charge_mix_recipe"),
-			p.get("downtime_type"),
-			p.get("melting_batch"),
-			p.get("mother_coil"),
-			p.get("remarks"),
-		]
-		data.append(row)
+	if cint(enqueue_only):
+		return {"queued": False}
+
+	return _send_export_file(rows, caster, start, end, format)
+
+
+def _send_export_file(rows, caster, start, end, format):
+	"""Set the export file as the response of the current request"""
+	file_name = _get_export_file_name(caster, start, end, format)
 
 	# Generate file based on format
 	if format == "csv":
-		import csv
-		import io
-		
-		output = io.StringIO()
-		writer = csv.writer(output)
-		for row in data:
-			# Convert None values to empty string for CSV
-			writer.writerow([str(cell) if cell is not None else "" for cell in row])
-		
-		file_content = output.getvalue()
-		file_name = f"PPC-Casting-Plan-{caster}-{start[:10]}-to-{end[:10]}.csv"
-		
-		frappe.response["filename"] = file_name
-		frappe.response["filecontent"] = file_content
-		frappe.response["type"] = "download"
+		# Stream the file instead of building it in memory; the handler
+		# passes a returned Response straight to the client
+		response = Response(_iter_csv_chunks(rows), mimetype="text/csv")
+		response.headers["Content-Disposition"] = f'attachment; filename="{file_name}"'
+		return response
 	else:
 		# Default to Excel
-		xlsx_file = make_xlsx(data, "PPC Casting Plan")
-		file_name = f"PPC-Casting-Plan-{caster}-{start[:10]}-to-{end[:10]}.xlsx"
+		# make_xlsx writes a write-only workbook row by row from any iterable;
+		# datetimes are passed through so they become native Excel date cells
+		xlsx_file = make_xlsx(rows, "PPC Casting Plan")
 
 		frappe.response["filename"] = file_name
 		frappe.response["filecontent"] = xlsx_file.getvalue()
 		frappe.response["type"] = "binary"
 
 
+def export_plans_async(caster, start, end, format="xlsx"):
+	"""Background job for large export_plans ranges: save a private File and notify the user"""
+	rows = _get_export_rows(caster, start, end)
+	if rows is None:
+		frappe.publish_realtime(
+			"ppc_plan_export_ready",
+			{"error": _("No plans found for the selected period.")},
+			user=frappe.session.user,
+		)
+		return
+
+	if format == "csv":
+		content = b"".join(_iter_csv_chunks(rows))
+	else:
+		content = make_xlsx(rows, "PPC Casting Plan").getvalue()
+
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": _get_export_file_name(caster, start, end, format),
+		"content": content,
+		"is_private": 1,
+	}).insert(ignore_permissions=True)
+	frappe.db.commit()
+
+	frappe.publish_realtime(
+		"ppc_plan_export_ready",
+		{"file_url": file_doc.file_url, "file_name": file_doc.file_name},
+		user=frappe.session.user,
+	)
+
+
 # Keep old function for backward compatibility
 @frappe.whitelist()
 def export_plan_excel(caster, start, end):
-	"""Backward compatible Excel export."""
-	return export_plans(caster, start, end, format="xlsx")
+	"""
+	Backward compatible Excel export.
+
+	Always builds the file in the request, whatever the range, so existing
+	callers keep getting file content instead of {"queued": True}.
+	"""
+	if not caster:
+		frappe.throw(_("Caster is required for export."))
+
+	rows = _get_export_rows(caster, start, end)
+	if rows is None:
+		frappe.throw(_("No plans found for the selected period."))
+
+	return _send_export_file(rows, caster, start, end, "xlsx")
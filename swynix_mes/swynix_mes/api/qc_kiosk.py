@@ -14,102 +14,156 @@ This module provides:
 
 import frappe
 from frappe import _
-from frappe.utils import flt, now_datetime, get_datetime, getdate
-
-
-# ==================== ELEMENT CODE MAPPING ====================
-
-# Common element symbol mappings
-ELEMENT_SYMBOLS = {
-    "silicon": "Si", "si": "Si",
-    "iron": "Fe", "fe": "Fe",
-    "copper": "Cu", "cu": "Cu",
-    "manganese": "Mn", "mn": "Mn",
-    "magnesium": "Mg", "mg": "Mg",
-    "zinc": "Zn", "zn": "Zn",
-    "titanium": "Ti", "ti": "Ti",
-    "aluminium": "Al", "aluminum": "Al", "al": "Al",
-    "chromium": "Cr", "cr": "Cr",
-    "nickel": "Ni", "ni": "Ni",
-    "lead": "Pb", "pb": "Pb",
-    "tin": "Sn", "sn": "Sn",
-    "vanadium": "V", "v": "V",
-    "zirconium": "Zr", "zr": "Zr",
-    "boron": "B", "b": "B",
-    "calcium": "Ca", "ca": "Ca",
-    "sodium": "Na", "na": "Na",
-    "phosphorus": "P", "p": "P",
-    "sulfur": "S", "s": "S",
-    "beryllium": "Be", "be": "Be",
-    "bismuth": "Bi", "bi": "Bi",
-    "cadmium": "Cd", "cd": "Cd",
-    "gallium": "Ga", "ga": "Ga",
-    "lithium": "Li", "li": "Li",
-    "strontium": "Sr", "sr": "Sr",
-}
+from frappe.utils import cint, flt, now_datetime, get_datetime, getdate
+
+from swynix_mes.swynix_mes.utils.composition_check import (
+    ELEMENT_SYMBOLS,
+    get_active_composition_master,
+    get_element_code,
+)
+from swynix_mes.swynix_mes.doctype.melting_batch.melting_batch import (
+    QC_SAMPLE_LIST_CACHE_PREFIX,
+    QC_SAMPLE_LIST_CACHE_TTL,
+    clear_qc_sample_list_cache,
+)
+
+
+# Memoized result of _has_elements_field; only a positive answer is kept
+_HAS_ELEMENTS_FIELD = None
 
 
-def get_element_code(item_name):
+def _has_elements_field():
     """
-    Extract element code from item name.
-    E.g., "Si" from "Silicon", "Fe" from "Iron", etc.
+    Whether Melting Batch Spectro Sample has the 'elements' child table
+    (it is missing until the migration adding it has been run).
+
+    Once the field exists it does not go away, so a True result is kept for
+    the life of the process; a False result is re-checked on the next call.
     """
-    if not item_name:
-        return None
-    
-    item_lower = item_name.strip().lower()
-    
-    # Try direct match first
-    if item_lower in ELEMENT_SYMBOLS:
-        return ELEMENT_SYMBOLS[item_lower]
-    
-    # Check if it's already a valid symbol (1-2 chars)
-    if len(item_name) <= 2:
-        return item_name.capitalize()
-    
-    # Try partial match
-    for key, symbol in ELEMENT_SYMBOLS.items():
-        if key in item_lower:
-            return symbol
-    
-    return item_name  # Return as-is if no match
+    global _HAS_ELEMENTS_FIELD
+    if _HAS_ELEMENTS_FIELD:
+        return True
+
+    try:
+        has_field = frappe.get_meta("Melting Batch Spectro Sample").get_field("elements") is not None
+    except Exception:
+        has_field = False
+
+    if has_field:
+        _HAS_ELEMENTS_FIELD = True
+    return has_field
 
 
 # ==================== COMPOSITION MASTER HELPERS ====================
 
-def get_active_composition_master(alloy):
+def _get_active_composition_master_ref(alloy):
+    """name and modified of the active composition master for an alloy, or None"""
+    accm = get_active_composition_master(alloy)
+    if not accm:
+        return None
+    return frappe._dict(name=accm.name, modified=accm.modified)
+
+
+ACCM_ELEMENT_TEMPLATES_CACHE_PREFIX = "swynix_mes:accm_element_templates"
+ACCM_ELEMENT_TEMPLATES_CACHE_TTL = 3600  # seconds
+
+# Composition rule fields needed to build element result rows
+ACCM_TEMPLATE_RULE_FIELDS = [
+    "name", "condition_type", "element_1", "limit_type",
+    "min_percentage", "max_percentage",
+    "sum_limit_type", "sum_min_percentage", "sum_max_percentage",
+    "ratio_value_1", "ratio_value_2", "remainder_min_percentage",
+]
+
+
+def build_element_templates(composition_master):
     """
-    Returns the active Alloy Chemical Composition Master doc for a given alloy.
-    
-    Logic:
-    - Filter by alloy and is_active = 1
-    - If multiple, pick the one with latest revision_date (or highest revision_no)
-    
-    Args:
-        alloy: Item name/code for the alloy
-        
-    Returns:
-        frappe.Document or None
+    Element result rows (as dicts) a new spectro sample gets for a
+    composition master: one per measurable rule, with its spec fields.
     """
-    if not alloy:
-        return None
-    
-    # Find active composition masters for this alloy
-    masters = frappe.get_all(
-        "Alloy Chemical Composition Master",
+    rules = frappe.get_all(
+        "Alloy Chemical Rule Detail",
         filters={
-            "alloy": alloy,
-            "is_active": 1
+            "parent": composition_master,
+            "parenttype": "Alloy Chemical Composition Master",
+            "parentfield": "composition_rules",
         },
-        fields=["name", "revision_no", "revision_date"],
-        order_by="revision_date desc, revision_no desc, creation desc",
-        limit=1
+        fields=ACCM_TEMPLATE_RULE_FIELDS,
+        order_by="idx asc",
     )
     
-    if not masters:
-        return None
+    templates = []
+    for rule in rules:
+        condition_type = rule.condition_type
+        
+        # Skip Free Text rules - they don't have measurable elements
+        if condition_type == "Free Text":
+            continue
+        
+        # Get element info
+        if not rule.element_1:
+            continue
+        
+        template = {
+            "element": rule.element_1,
+            "rule_row": rule.name,
+            "condition_type": condition_type,
+            "in_spec": 1,  # Default to in-spec until evaluated
+        }
+        
+        if condition_type == "Normal Limit":
+            template["limit_type"] = rule.limit_type
+            template["spec_min_pct"] = rule.min_percentage
+            template["spec_max_pct"] = rule.max_percentage
+            
+            # Calculate target as midpoint if both min and max exist
+            if rule.min_percentage is not None and rule.max_percentage is not None:
+                template["spec_target_pct"] = (flt(rule.min_percentage) + flt(rule.max_percentage)) / 2
+            elif rule.min_percentage is not None:
+                template["spec_target_pct"] = rule.min_percentage
+            elif rule.max_percentage is not None:
+                template["spec_target_pct"] = rule.max_percentage
+                
+        elif condition_type == "Sum Limit":
+            template["limit_type"] = rule.sum_limit_type
+            # For sum limit, max_pct stores the sum limit
+            if rule.sum_limit_type == "Maximum":
+                template["sum_limit_pct"] = rule.sum_max_percentage
+            elif rule.sum_limit_type == "Minimum":
+                template["sum_limit_pct"] = rule.sum_min_percentage
+            else:
+                # Range - store max
+                template["sum_limit_pct"] = rule.sum_max_percentage
+                template["spec_min_pct"] = rule.sum_min_percentage
+                template["spec_max_pct"] = rule.sum_max_percentage
+                
+        elif condition_type == "Ratio":
+            # Store ratio values
+            if rule.ratio_value_1 and rule.ratio_value_2:
+                # Calculate expected ratio
+                template["ratio_value"] = flt(rule.ratio_value_1) / flt(rule.ratio_value_2)
+                
+        elif condition_type == "Remainder":
+            template["limit_type"] = "Minimum"
+            template["spec_min_pct"] = rule.remainder_min_percentage
+        
+        templates.append(template)
     
-    return frappe.get_doc("Alloy Chemical Composition Master", masters[0].name)
+    return templates
+
+
+def get_element_templates(composition_master, modified):
+    """
+    build_element_templates through redis. The key carries the master's
+    modified timestamp, so editing the master starts a fresh entry; the
+    master's on_update builds it right away.
+    """
+    cache_key = f"{ACCM_ELEMENT_TEMPLATES_CACHE_PREFIX}:{composition_master}:{modified}"
+    templates = frappe.cache().get_value(cache_key)
+    if templates is None:
+        templates = build_element_templates(composition_master)
+        frappe.cache().set_value(cache_key, templates, expires_in_sec=ACCM_ELEMENT_TEMPLATES_CACHE_TTL)
+    return templates
 
 
 @frappe.whitelist()
@@ -121,70 +175,99 @@ def get_composition_master_for_alloy(alloy):
     if not alloy:
         return None
     
-    master = get_active_composition_master(alloy)
+    master = _get_active_composition_master_ref(alloy)
     if not master:
         return None
     
-    return {
-        "name": master.name,
-        "alloy": master.alloy,
-        "alloy_name": master.alloy_name,
-        "standard_reference": master.standard_reference,
-        "revision_no": master.revision_no,
-        "revision_date": str(master.revision_date) if master.revision_date else None,
-        "rules_count": len(master.composition_rules or [])
-    }
+    return get_composition_master_info(master.name)
+
+
+def get_composition_master_info(composition_master):
+    """
+    Header fields and rule count of a composition master, without loading
+    its rules table. Returns None if it does not exist.
+    """
+    info = frappe.db.get_value(
+        "Alloy Chemical Composition Master",
+        composition_master,
+        ["name", "alloy", "alloy_name", "standard_reference", "revision_no", "revision_date"],
+        as_dict=True
+    )
+    if not info:
+        return None
+    
+    info.revision_date = str(info.revision_date) if info.revision_date else None
+    info.rules_count = frappe.db.count(
+        "Alloy Chemical Rule Detail",
+        {
+            "parent": composition_master,
+            "parenttype": "Alloy Chemical Composition Master",
+            "parentfield": "composition_rules",
+        },
+    )
+    return info
 
 
 # ==================== SAMPLE CREATION ====================
 
-@frappe.whitelist()
-def create_spectro_sample(melting_batch_name, sample_id=None):
+def _lock_batch_for_samples(melting_batch_name):
     """
-    Create a new spectro sample for a melting batch with pre-populated elements
-    from the Alloy Chemical Composition Master.
-    
-    This function:
-    1. Loads the Melting Batch
-    2. Resolves alloy from batch
-    3. Gets ACCM via get_active_composition_master(alloy)
-    4. Creates a new child row in batch.spectro_samples with:
-       - sample_id = next "S1", "S2", ...
-       - sample_time = now_datetime()
-       - status = "Pending"
-       - spec_master = ACCM.name
-       - overall_result = "Pending"
-    5. For each composition rule in ACCM.composition_rules:
-       - Creates a Melting Sample Element Result row with spec fields
-    6. Saves batch
-    7. Returns the created sample info
-    
-    Args:
-        melting_batch_name: Name of the Melting Batch document
-        sample_id: Optional custom sample ID (auto-generated if not provided)
-        
-    Returns:
-        dict with sample info
+    Header fields of a draft Melting Batch the user may write, read with a
+    row lock that serialises concurrent sample creation so sample numbers
+    and row positions stay unique.
     """
     if not melting_batch_name:
         frappe.throw(_("Melting Batch is required."))
     
-    batch = frappe.get_doc("Melting Batch", melting_batch_name)
-    alloy = batch.alloy
-    
-    # Determine next sample ID if not provided
-    if not sample_id:
-        existing_ids = [s.sample_id for s in batch.spectro_samples if s.sample_id]
-        idx = len(existing_ids) + 1
-        sample_id = f"S{idx}"
-    
-    # Get active composition master for the alloy
-    accm = get_active_composition_master(alloy) if alloy else None
-    
-    # Create spectro sample row
-    sample_row = batch.append("spectro_samples", {})
+    # Rows are inserted without saving the batch, so check what a save would
+    frappe.has_permission("Melting Batch", "write", melting_batch_name, throw=True)
+    
+    batch = frappe.db.sql("""
+        SELECT name, docstatus, alloy, furnace, product_item, temper, ppc_casting_plan
+        FROM `tabMelting Batch`
+        WHERE name = %s
+        FOR UPDATE
+    """, (melting_batch_name,), as_dict=True)
+    if not batch:
+        frappe.throw(_("Melting Batch {0} not found").format(melting_batch_name), frappe.DoesNotExistError)
+    batch = batch[0]
+    if batch.docstatus != 0:
+        frappe.throw(_("Cannot add samples to Melting Batch {0} after it is submitted or cancelled").format(batch.name))
+    return batch
+
+
+def _get_sample_counts(batch_name):
+    """Sample count and next row positions, without loading the child tables"""
+    return frappe.db.sql("""
+        SELECT
+            (SELECT COUNT(*) FROM `tabMelting Batch Spectro Sample`
+             WHERE parent = %(batch)s AND parenttype = 'Melting Batch'
+               AND parentfield = 'spectro_samples' AND IFNULL(sample_id, '') != '') AS sample_count,
+            (SELECT IFNULL(MAX(idx), 0) FROM `tabMelting Batch Spectro Sample`
+             WHERE parent = %(batch)s AND parenttype = 'Melting Batch'
+               AND parentfield = 'spectro_samples') AS sample_idx,
+            (SELECT IFNULL(MAX(idx), 0) FROM `tabMelting Batch Process Log`
+             WHERE parent = %(batch)s AND parenttype = 'Melting Batch'
+               AND parentfield = 'process_logs') AS log_idx
+    """, {"batch": batch_name}, as_dict=True)[0]
+
+
+def _new_spectro_sample(batch, accm, sample_id, idx, sample_time):
+    """
+    Unsaved spectro sample row (named up front so the name is known before
+    insert) with element rows from the composition master's templates,
+    and its "Sample Taken" process log row.
+    """
+    sample_row = frappe.get_doc({
+        "doctype": "Melting Batch Spectro Sample",
+        "parent": batch.name,
+        "parenttype": "Melting Batch",
+        "parentfield": "spectro_samples",
+        "idx": idx,
+    })
+    sample_row.name = frappe.generate_hash(length=10)
     sample_row.sample_id = sample_id
-    sample_row.sample_time = now_datetime()
+    sample_row.sample_time = sample_time
     sample_row.status = "Pending"
     sample_row.overall_result = "Pending"
     sample_row.result_status = "Pending"  # Legacy field
@@ -192,102 +275,85 @@ def create_spectro_sample(melting_batch_name, sample_id=None):
     if accm:
         sample_row.spec_master = accm.name
         
-        # Check if the 'elements' child table field exists in the DocType
-        # This handles the case where the migration hasn't been run yet
-        has_elements_field = False
-        try:
-            sample_meta = frappe.get_meta("Melting Batch Spectro Sample")
-            elements_field = sample_meta.get_field("elements")
-            has_elements_field = elements_field is not None
-        except Exception:
-            has_elements_field = False
-        
-        if has_elements_field:
-            # Pre-populate element rows from composition rules
-            for rule in accm.composition_rules or []:
-                condition_type = rule.condition_type
-                
-                # Skip Free Text rules - they don't have measurable elements
-                if condition_type == "Free Text":
-                    continue
-                
-                # Get element info
-                element_1 = rule.element_1
-                if not element_1:
-                    continue
-                
-                element_code = get_element_code(element_1)
-                
-                # Build element result row
-                el_row = sample_row.append("elements", {})
-                el_row.element = element_1
-                el_row.rule_row = rule.name
-                el_row.condition_type = condition_type
-                el_row.in_spec = 1  # Default to in-spec until evaluated
-                
-                if condition_type == "Normal Limit":
-                    el_row.limit_type = rule.limit_type
-                    el_row.spec_min_pct = rule.min_percentage
-                    el_row.spec_max_pct = rule.max_percentage
-                    
-                    # Calculate target as midpoint if both min and max exist
-                    if rule.min_percentage is not None and rule.max_percentage is not None:
-                        el_row.spec_target_pct = (flt(rule.min_percentage) + flt(rule.max_percentage)) / 2
-                    elif rule.min_percentage is not None:
-                        el_row.spec_target_pct = rule.min_percentage
-                    elif rule.max_percentage is not None:
-                        el_row.spec_target_pct = rule.max_percentage
-                        
-                elif condition_type == "Sum Limit":
-                    el_row.limit_type = rule.sum_limit_type
-                    # For sum limit, max_pct stores the sum limit
-                    if rule.sum_limit_type == "Maximum":
-                        el_row.sum_limit_pct = rule.sum_max_percentage
-                    elif rule.sum_limit_type == "Minimum":
-                        el_row.sum_limit_pct = rule.sum_min_percentage
-                    else:
-                        # Range - store max
-                        el_row.sum_limit_pct = rule.sum_max_percentage
-                        el_row.spec_min_pct = rule.sum_min_percentage
-                        el_row.spec_max_pct = rule.sum_max_percentage
-                        
-                elif condition_type == "Ratio":
-                    # Store ratio values
-                    if rule.ratio_value_1 and rule.ratio_value_2:
-                        # Calculate expected ratio
-                        el_row.ratio_value = flt(rule.ratio_value_1) / flt(rule.ratio_value_2) if rule.ratio_value_2 else 0
-                        
-                elif condition_type == "Remainder":
-                    el_row.limit_type = "Minimum"
-                    el_row.spec_min_pct = rule.remainder_min_percentage
-    
-    # Also log process event
-    prow = batch.append("process_logs", {})
-    prow.log_time = sample_row.sample_time
-    prow.event_type = "Sample Taken"
-    prow.sample_id = sample_id
-    
-    batch.save()
-    frappe.db.commit()
+        # Skip element rows when the migration adding them hasn't been run yet
+        if _has_elements_field():
+            # Pre-populate element rows from the master's compiled templates
+            for template in get_element_templates(accm.name, accm.modified):
+                el = sample_row.append("elements", template)
+                el.name = frappe.generate_hash(length=10)
+    
+    return sample_row
+
+
+def _new_sample_log(batch, sample_row, idx):
+    """Unsaved "Sample Taken" process log row for a new spectro sample"""
+    return frappe.get_doc({
+        "doctype": "Melting Batch Process Log",
+        "parent": batch.name,
+        "parenttype": "Melting Batch",
+        "parentfield": "process_logs",
+        "idx": idx,
+        "log_time": sample_row.sample_time,
+        "event_type": "Sample Taken",
+        "sample_id": sample_row.sample_id,
+    })
+
+
+def _bulk_insert_rows(docs, now):
+    """Insert new child rows of one doctype with a single multi-row INSERT"""
+    if not docs:
+        return
+    
+    user = frappe.session.user
+    rows = []
+    for doc in docs:
+        doc.creation = doc.modified = now
+        doc.owner = doc.modified_by = user
+        rows.append(doc.get_valid_dict(convert_dates_to_str=True))
+    
+    fields = list(rows[0])
+    frappe.db.bulk_insert(docs[0].doctype, fields, [tuple(row[f] for f in fields) for row in rows])
+
+
+def _insert_spectro_samples(batch, sample_rows, log_rows):
+    """
+    Insert new sample rows, their element rows and process logs, one INSERT
+    per table, without loading or saving the batch.
+    """
+    now = now_datetime()
+    _bulk_insert_rows(sample_rows, now)
+    _bulk_insert_rows([el for row in sample_rows for el in row.get("elements") or []], now)
+    _bulk_insert_rows(log_rows, now)
+    frappe.db.set_value("Melting Batch", batch.name, "modified", now)
+    clear_qc_sample_list_cache()
+
+
+def _get_next_qc_sample_seq(batch_name):
+    """Next QC Sample sequence number for a melting batch"""
+    existing_samples = frappe.get_all(
+        "QC Sample",
+        filters={
+            "source_type": ["in", ["Melting", "Melting Batch"]],
+            "melting_batch": batch_name
+        },
+        fields=["sample_sequence_no"],
+        order_by="sample_sequence_no desc",
+        limit=1
+    )
     
-    # Create QC Sample record for QC Kiosk
+    if existing_samples and existing_samples[0].sample_sequence_no:
+        return existing_samples[0].sample_sequence_no + 1
+    return 1
+
+
+def _create_qc_sample(batch, sample_row, sample_seq):
+    """
+    Create the QC Sample record of a spectro sample for QC Kiosk. A failure
+    here must not undo the spectro sample, so only roll back to this
+    savepoint.
+    """
+    frappe.db.savepoint("create_qc_sample")
     try:
-        # Determine the next sequence number for this batch
-        existing_samples = frappe.get_all(
-            "QC Sample",
-            filters={
-                "source_type": ["in", ["Melting", "Melting Batch"]],
-                "melting_batch": batch.name
-            },
-            fields=["sample_sequence_no"],
-            order_by="sample_sequence_no desc",
-            limit=1
-        )
-        
-        sample_seq = 1
-        if existing_samples and existing_samples[0].sample_sequence_no:
-            sample_seq = existing_samples[0].sample_sequence_no + 1
-        
         qc_sample = frappe.new_doc("QC Sample")
         # Use standardized source_type = "Melting"
         qc_sample.source_type = "Melting"
@@ -295,8 +361,8 @@ def create_spectro_sample(melting_batch_name, sample_id=None):
         qc_sample.source_document = batch.name
         qc_sample.source_name = batch.name
         qc_sample.melting_batch = batch.name
-        qc_sample.sample_id = sample_id
-        qc_sample.sample_no = sample_id
+        qc_sample.sample_id = sample_row.sample_id
+        qc_sample.sample_no = sample_row.sample_id
         qc_sample.sample_sequence_no = sample_seq
         qc_sample.sample_time = sample_row.sample_time
         qc_sample.alloy = batch.alloy
@@ -306,7 +372,7 @@ def create_spectro_sample(melting_batch_name, sample_id=None):
         qc_sample.casting_plan = batch.ppc_casting_plan
         qc_sample.status = "Pending"
         qc_sample.overall_result = "Pending"
-        qc_sample.spec_master = accm.name if accm else None
+        qc_sample.spec_master = sample_row.spec_master
         
         # Copy element rows from spectro sample to QC Sample
         if hasattr(sample_row, 'elements') and sample_row.elements:
@@ -325,30 +391,309 @@ def create_spectro_sample(melting_batch_name, sample_id=None):
                 qc_el.in_spec = getattr(el_row, "in_spec", 1)
         
         qc_sample.insert(ignore_permissions=True)
-        frappe.db.commit()
     except Exception as e:
         # Log error but don't fail the sample creation
+        frappe.db.rollback(save_point="create_qc_sample")
         frappe.log_error(f"Failed to create QC Sample for melting batch {batch.name}: {str(e)}", "QC Sample Creation")
+
+
+@frappe.whitelist()
+def create_spectro_sample(melting_batch_name, sample_id=None):
+    """
+    Create a new spectro sample for a melting batch with pre-populated elements
+    from the Alloy Chemical Composition Master.
     
-    # Calculate elements count safely
-    elements_count = 0
-    try:
-        if hasattr(sample_row, 'elements') and sample_row.elements:
-            elements_count = len(sample_row.elements)
-    except Exception:
-        elements_count = 0
+    This function:
+    1. Loads the Melting Batch
+    2. Resolves alloy from batch
+    3. Gets ACCM via get_active_composition_master(alloy)
+    4. Creates a new child row in batch.spectro_samples with:
+       - sample_id = next "S1", "S2", ...
+       - sample_time = now_datetime()
+       - status = "Pending"
+       - spec_master = ACCM.name
+       - overall_result = "Pending"
+    5. For each composition rule in ACCM.composition_rules:
+       - Creates a Melting Sample Element Result row with spec fields
+    6. Saves batch
+    7. Returns the created sample info
+    
+    Args:
+        melting_batch_name: Name of the Melting Batch document
+        sample_id: Optional custom sample ID (auto-generated if not provided)
+        
+    Returns:
+        dict with sample info
+    """
+    batch = _lock_batch_for_samples(melting_batch_name)
+    counts = _get_sample_counts(batch.name)
+    
+    # Determine next sample ID if not provided
+    if not sample_id:
+        sample_id = f"S{cint(counts.sample_count) + 1}"
+    
+    # Active composition master for the alloy (name and modified are enough;
+    # its element rows come from the compiled templates)
+    accm = _get_active_composition_master_ref(batch.alloy) if batch.alloy else None
+    
+    sample_row = _new_spectro_sample(batch, accm, sample_id, cint(counts.sample_idx) + 1, now_datetime())
+    prow = _new_sample_log(batch, sample_row, cint(counts.log_idx) + 1)
+    
+    # Only new rows are added, so insert them without loading or saving the batch
+    _insert_spectro_samples(batch, [sample_row], [prow])
+    
+    _create_qc_sample(batch, sample_row, _get_next_qc_sample_seq(batch.name))
     
     return {
         "sample_id": sample_id,
         "sample_row_name": sample_row.name,
         "spec_master": accm.name if accm else None,
-        "elements_count": elements_count,
+        "elements_count": len(sample_row.get("elements") or []),
         "batch_name": batch.name
     }
 
 
+@frappe.whitelist()
+def create_spectro_samples_bulk(melting_batch_name, samples):
+    """
+    Create several spectro samples for a melting batch at once, e.g. when a
+    spectrometer or LIMS pushes a run of results.
+    
+    Rows are built as in create_spectro_sample, then the sample, element
+    and process log rows are written with one INSERT per table.
+    
+    Args:
+        melting_batch_name: Name of the Melting Batch document
+        samples: list of dicts, each with an optional sample_id and an
+            optional readings dict of {element_code_or_name: sample_pct};
+            samples with readings are evaluated and moved to In Lab
+        
+    Returns:
+        list of dicts with sample info, in the order given
+    """
+    import json
+    
+    if isinstance(samples, str):
+        samples = json.loads(samples)
+    
+    if not samples:
+        frappe.throw(_("At least one sample is required."))
+    
+    batch = _lock_batch_for_samples(melting_batch_name)
+    counts = _get_sample_counts(batch.name)
+    accm = _get_active_composition_master_ref(batch.alloy) if batch.alloy else None
+    sample_time = now_datetime()
+    
+    sample_rows = []
+    log_rows = []
+    for i, sample in enumerate(samples):
+        sample_id = sample.get("sample_id") or f"S{cint(counts.sample_count) + i + 1}"
+        sample_row = _new_spectro_sample(batch, accm, sample_id, cint(counts.sample_idx) + i + 1, sample_time)
+        
+        if sample.get("readings"):
+            _apply_readings(sample_row, sample["readings"])
+            evaluate_sample_qc(sample_row)
+        
+        sample_rows.append(sample_row)
+        log_rows.append(_new_sample_log(batch, sample_row, cint(counts.log_idx) + i + 1))
+    
+    _insert_spectro_samples(batch, sample_rows, log_rows)
+    
+    sample_seq = _get_next_qc_sample_seq(batch.name)
+    for i, sample_row in enumerate(sample_rows):
+        _create_qc_sample(batch, sample_row, sample_seq + i)
+    
+    return [
+        {
+            "sample_id": sample_row.sample_id,
+            "sample_row_name": sample_row.name,
+            "status": sample_row.status,
+            "overall_result": sample_row.overall_result,
+            "elements_count": len(sample_row.get("elements") or []),
+        }
+        for sample_row in sample_rows
+    ]
+
+
 # ==================== QC EVALUATION LOGIC ====================
 
+ACCM_RULES_CACHE_PREFIX = "swynix_mes:accm_rules"
+ACCM_RULES_CACHE_TTL = 3600  # seconds
+
+# Composition rule fields read by evaluate_sample_qc
+ACCM_RULE_FIELDS = [
+    "name", "element_1", "element_2", "element_3",
+    "sum_limit_type", "sum_min_percentage", "sum_max_percentage",
+]
+
+
+def _get_rule_lookup(spec_master):
+    """
+    {rule row name: rule} for an Alloy Chemical Composition Master, with
+    only ACCM_RULE_FIELDS. Cached in redis under the master's modified
+    timestamp, so editing the master starts a fresh entry.
+    """
+    modified = frappe.db.get_value("Alloy Chemical Composition Master", spec_master, "modified")
+    if not modified:
+        return {}
+
+    cache_key = f"{ACCM_RULES_CACHE_PREFIX}:{spec_master}:{modified}"
+    rule_lookup = frappe.cache().get_value(cache_key)
+    if rule_lookup is None:
+        rules = frappe.get_all(
+            "Alloy Chemical Rule Detail",
+            filters={
+                "parent": spec_master,
+                "parenttype": "Alloy Chemical Composition Master",
+                "parentfield": "composition_rules",
+            },
+            fields=ACCM_RULE_FIELDS,
+        )
+        rule_lookup = {rule.name: rule for rule in rules}
+        frappe.cache().set_value(cache_key, rule_lookup, expires_in_sec=ACCM_RULES_CACHE_TTL)
+
+    return rule_lookup
+
+
+# Condition handlers for evaluate_sample_qc. Each gets an element row with a
+# reading and returns the violation text, or None when the row is in spec.
+
+def _eval_normal_limit(el, sample_pct, element_code, rule_lookup, val):
+    """Normal Limit: min/max/equal/range check against the row's spec"""
+    limit_type = el.limit_type or ""
+    
+    if limit_type == "Maximum":
+        if el.spec_max_pct is not None and sample_pct > flt(el.spec_max_pct):
+            return f"{element_code} {sample_pct:.4f}% > {el.spec_max_pct:.4f}% (Max)"
+            
+    elif limit_type == "Minimum":
+        if el.spec_min_pct is not None and sample_pct < flt(el.spec_min_pct):
+            return f"{element_code} {sample_pct:.4f}% < {el.spec_min_pct:.4f}% (Min)"
+            
+    elif limit_type == "Equal To":
+        target = el.spec_target_pct or el.spec_min_pct or el.spec_max_pct
+        if target is not None:
+            # Allow small tolerance (0.01%)
+            tolerance = 0.01
+            if abs(sample_pct - flt(target)) > tolerance:
+                return f"{element_code} {sample_pct:.4f}% ≠ {target:.4f}%"
+                
+    else:  # Range or unspecified
+        min_pct = el.spec_min_pct
+        max_pct = el.spec_max_pct
+        
+        if min_pct is not None and sample_pct < flt(min_pct):
+            return f"{element_code} {sample_pct:.4f}% < {min_pct:.4f}% (Min)"
+        elif max_pct is not None and sample_pct > flt(max_pct):
+            return f"{element_code} {sample_pct:.4f}% > {max_pct:.4f}% (Max)"
+    
+    return None
+
+
+def _eval_sum_limit(el, sample_pct, element_code, rule_lookup, val):
+    """Sum Limit: sum of the rule's elements against the sum limit"""
+    # Get the original rule to find participating elements
+    rule_name = el.rule_row
+    rule = rule_lookup.get(rule_name) if rule_name else None
+    if not rule:
+        return None
+    
+    # Get all participating elements
+    sum_elements = []
+    if rule.element_1:
+        sum_elements.append(rule.element_1)
+    if rule.element_2:
+        sum_elements.append(rule.element_2)
+    if rule.element_3:
+        sum_elements.append(rule.element_3)
+    
+    sum_codes = [get_element_code(e) for e in sum_elements]
+    
+    # Calculate sum
+    sum_val = 0
+    for elem, elem_code in zip(sum_elements, sum_codes, strict=True):
+        sum_val += val.get(elem_code, 0) or val.get(elem, 0)
+    
+    # Check against limit; the message (and its label) is only
+    # built for a violated limit, the rare path
+    violated = None  # (operator, limit)
+    
+    sum_limit_type = rule.sum_limit_type or el.limit_type or ""
+    
+    if sum_limit_type == "Maximum":
+        sum_max = rule.sum_max_percentage
+        if sum_max is not None and sum_val > flt(sum_max):
+            violated = (">", sum_max)
+            
+    elif sum_limit_type == "Minimum":
+        sum_min = rule.sum_min_percentage
+        if sum_min is not None and sum_val < flt(sum_min):
+            violated = ("<", sum_min)
+            
+    else:  # Range
+        sum_min = rule.sum_min_percentage
+        sum_max = rule.sum_max_percentage
+        if sum_min is not None and sum_val < flt(sum_min):
+            violated = ("<", sum_min)
+        elif sum_max is not None and sum_val > flt(sum_max):
+            violated = (">", sum_max)
+    
+    if not violated:
+        return None
+    
+    op, limit = violated
+    sum_label = "+".join(sum_codes)
+    return f"{sum_label} = {sum_val:.4f}% {op} {limit:.4f}%"
+
+
+def _eval_ratio(el, sample_pct, element_code, rule_lookup, val):
+    """Ratio: element_1 / element_2 within 10% of the expected ratio"""
+    # Get the original rule
+    rule_name = el.rule_row
+    rule = rule_lookup.get(rule_name) if rule_name else None
+    if not (rule and rule.element_1 and rule.element_2):
+        return None
+    
+    elem1_code = get_element_code(rule.element_1)
+    elem2_code = get_element_code(rule.element_2)
+    
+    val1 = val.get(elem1_code, 0) or val.get(rule.element_1, 0)
+    val2 = val.get(elem2_code, 0) or val.get(rule.element_2, 0)
+    
+    if val2 and val2 > 0:
+        actual_ratio = val1 / val2
+        expected_ratio = el.ratio_value or 0
+        
+        if expected_ratio:
+            # Allow 10% tolerance on ratio
+            tolerance = 0.1
+            ratio_diff = abs(actual_ratio - expected_ratio) / expected_ratio
+            
+            if ratio_diff > tolerance:
+                return f"{elem1_code}/{elem2_code} = {actual_ratio:.2f} (expected ~{expected_ratio:.2f})"
+    elif val1 > 0:
+        return f"Cannot calculate ratio: {elem2_code} = 0"
+    
+    return None
+
+
+def _eval_remainder(el, sample_pct, element_code, rule_lookup, val):
+    """Remainder: minimum percentage (usually Aluminium)"""
+    min_pct = el.spec_min_pct
+    if min_pct is not None and sample_pct < flt(min_pct):
+        return f"{element_code} {sample_pct:.4f}% < {min_pct:.4f}% (Min)"
+    return None
+
+
+# condition_type -> handler; other condition types are not evaluated
+CONDITION_HANDLERS = {
+    "Normal Limit": _eval_normal_limit,
+    "Sum Limit": _eval_sum_limit,
+    "Ratio": _eval_ratio,
+    "Remainder": _eval_remainder,
+}
+
+
 def evaluate_sample_qc(sample_doc, batch_doc=None):
     """
     Evaluate QC for a spectro sample based on ACCM rules.
@@ -373,23 +718,38 @@ def evaluate_sample_qc(sample_doc, batch_doc=None):
     if not sample_doc:
         return {"overall_result": "Pending", "errors": ["No sample provided"]}
     
-    elements = getattr(sample_doc, 'elements', []) or []
+    # elements and spec_master come with the same migration; once it has
+    # run, read them directly instead of probing with getattr
+    if _has_elements_field():
+        elements = sample_doc.elements or []
+        spec_master = sample_doc.spec_master
+    else:
+        elements = getattr(sample_doc, 'elements', []) or []
+        spec_master = getattr(sample_doc, 'spec_master', None)
+    
     if not elements:
         return {"overall_result": "Pending", "errors": ["No elements to evaluate"]}
     
-    # Build value dict: {element_code: sample_pct}
+    # Build value dict: {element_code: sample_pct}, converting each reading
+    # and element code once; the lists keep them per row for the pass below
     val = {}
     element_map = {}  # Map element name to element row
+    sample_values = []
+    element_codes = []
     
     for el in elements:
         element_name = el.element
         element_code = get_element_code(element_name) if element_name else None
         
-        if el.sample_pct is not None:
+        sample_pct = flt(el.sample_pct) if el.sample_pct is not None else None
+        sample_values.append(sample_pct)
+        element_codes.append(element_code)
+        
+        if sample_pct is not None:
             if element_code:
-                val[element_code] = flt(el.sample_pct)
+                val[element_code] = sample_pct
             if element_name:
-                val[element_name] = flt(el.sample_pct)
+                val[element_name] = sample_pct
                 element_map[element_name] = el
     
     # Track evaluation results
@@ -397,175 +757,33 @@ def evaluate_sample_qc(sample_doc, batch_doc=None):
     evaluated_count = 0
     pending_count = 0
     
-    # Get ACCM for sum/ratio rule lookups
-    spec_master = getattr(sample_doc, 'spec_master', None)
-    accm = None
-    if spec_master:
-        try:
-            accm = frappe.get_doc("Alloy Chemical Composition Master", spec_master)
-        except Exception:
-            pass
-    
-    # Build rule lookup by name
-    rule_lookup = {}
-    if accm:
-        for rule in accm.composition_rules or []:
-            rule_lookup[rule.name] = rule
+    # ACCM rules by row name, for sum/ratio rule lookups
+    rule_lookup = _get_rule_lookup(spec_master) if spec_master else {}
     
     # Evaluate each element
-    for el in elements:
+    for el, sample_pct, element_code in zip(elements, sample_values, element_codes, strict=True):
         # Reset evaluation fields
         el.in_spec = 1
         el.condition_violated = ""
         el.deviation_pct = None
         
         # If no sample value, mark as pending
-        if el.sample_pct is None:
+        if sample_pct is None:
             pending_count += 1
             continue
         
         evaluated_count += 1
-        sample_pct = flt(el.sample_pct)
-        condition_type = el.condition_type or "Normal Limit"
-        limit_type = el.limit_type or ""
         
         # Calculate deviation from target
         if el.spec_target_pct is not None:
             el.deviation_pct = flt(sample_pct - flt(el.spec_target_pct), 4)
         
-        if condition_type == "Normal Limit":
-            # Evaluate based on limit_type
-            is_ok = True
-            violation = ""
-            
-            if limit_type == "Maximum":
-                if el.spec_max_pct is not None and sample_pct > flt(el.spec_max_pct):
-                    is_ok = False
-                    violation = f"{get_element_code(el.element)} {sample_pct:.4f}% > {el.spec_max_pct:.4f}% (Max)"
-                    
-            elif limit_type == "Minimum":
-                if el.spec_min_pct is not None and sample_pct < flt(el.spec_min_pct):
-                    is_ok = False
-                    violation = f"{get_element_code(el.element)} {sample_pct:.4f}% < {el.spec_min_pct:.4f}% (Min)"
-                    
-            elif limit_type == "Equal To":
-                target = el.spec_target_pct or el.spec_min_pct or el.spec_max_pct
-                if target is not None:
-                    # Allow small tolerance (0.01%)
-                    tolerance = 0.01
-                    if abs(sample_pct - flt(target)) > tolerance:
-                        is_ok = False
-                        violation = f"{get_element_code(el.element)} {sample_pct:.4f}% ≠ {target:.4f}%"
-                        
-            else:  # Range or unspecified
-                min_pct = el.spec_min_pct
-                max_pct = el.spec_max_pct
-                
-                if min_pct is not None and sample_pct < flt(min_pct):
-                    is_ok = False
-                    violation = f"{get_element_code(el.element)} {sample_pct:.4f}% < {min_pct:.4f}% (Min)"
-                elif max_pct is not None and sample_pct > flt(max_pct):
-                    is_ok = False
-                    violation = f"{get_element_code(el.element)} {sample_pct:.4f}% > {max_pct:.4f}% (Max)"
-            
-            if not is_ok:
-                el.in_spec = 0
-                el.condition_violated = violation
-                out_of_spec_count += 1
-                
-        elif condition_type == "Sum Limit":
-            # Get the original rule to find participating elements
-            rule_name = el.rule_row
-            rule = rule_lookup.get(rule_name) if rule_name else None
-            
-            if rule:
-                # Get all participating elements
-                sum_elements = []
-                if rule.element_1:
-                    sum_elements.append(rule.element_1)
-                if rule.element_2:
-                    sum_elements.append(rule.element_2)
-                if rule.element_3:
-                    sum_elements.append(rule.element_3)
-                
-                # Calculate sum
-                sum_val = 0
-                for elem in sum_elements:
-                    elem_code = get_element_code(elem)
-                    sum_val += val.get(elem_code, 0) or val.get(elem, 0)
-                
-                # Check against limit
-                is_ok = True
-                violation = ""
-                sum_label = "+".join([get_element_code(e) for e in sum_elements])
-                
-                sum_limit_type = rule.sum_limit_type or limit_type
-                
-                if sum_limit_type == "Maximum":
-                    sum_max = rule.sum_max_percentage
-                    if sum_max is not None and sum_val > flt(sum_max):
-                        is_ok = False
-                        violation = f"{sum_label} = {sum_val:.4f}% > {sum_max:.4f}%"
-                        
-                elif sum_limit_type == "Minimum":
-                    sum_min = rule.sum_min_percentage
-                    if sum_min is not None and sum_val < flt(sum_min):
-                        is_ok = False
-                        violation = f"{sum_label} = {sum_val:.4f}% < {sum_min:.4f}%"
-                        
-                else:  # Range
-                    sum_min = rule.sum_min_percentage
-                    sum_max = rule.sum_max_percentage
-                    if sum_min is not None and sum_val < flt(sum_min):
-                        is_ok = False
-                        violation = f"{sum_label} = {sum_val:.4f}% < {sum_min:.4f}%"
-                    elif sum_max is not None and sum_val > flt(sum_max):
-                        is_ok = False
-                        violation = f"{sum_label} = {sum_val:.4f}% > {sum_max:.4f}%"
-                
-                if not is_ok:
-                    el.in_spec = 0
-                    el.condition_violated = violation
-                    out_of_spec_count += 1
-                    
-        elif condition_type == "Ratio":
-            # Get the original rule
-            rule_name = el.rule_row
-            rule = rule_lookup.get(rule_name) if rule_name else None
-            
-            if rule and rule.element_1 and rule.element_2:
-                elem1_code = get_element_code(rule.element_1)
-                elem2_code = get_element_code(rule.element_2)
-                
-                val1 = val.get(elem1_code, 0) or val.get(rule.element_1, 0)
-                val2 = val.get(elem2_code, 0) or val.get(rule.element_2, 0)
-                
-                if val2 and val2 > 0:
-                    actual_ratio = val1 / val2
-                    expected_ratio = el.ratio_value or 0
-                    
-                    if expected_ratio:
-                        # Allow 10% tolerance on ratio
-                        tolerance = 0.1
-                        ratio_diff = abs(actual_ratio - expected_ratio) / expected_ratio
-                        
-                        if ratio_diff > tolerance:
-                            el.in_spec = 0
-                            el.condition_violated = f"{elem1_code}/{elem2_code} = {actual_ratio:.2f} (expected ~{expected_ratio:.2f})"
-                            out_of_spec_count += 1
-                else:
-                    if val1 > 0:
-                        el.in_spec = 0
-                        el.condition_violated = f"Cannot calculate ratio: {elem2_code} = 0"
-                        out_of_spec_count += 1
-                        
-        elif condition_type == "Remainder":
-            # Check minimum for remainder (usually Aluminium)
-            min_pct = el.spec_min_pct
-            if min_pct is not None and sample_pct < flt(min_pct):
-                el.in_spec = 0
-                el.condition_violated = f"{get_element_code(el.element)} {sample_pct:.4f}% < {min_pct:.4f}% (Min)"
-                out_of_spec_count += 1
+        handler = CONDITION_HANDLERS.get(el.condition_type or "Normal Limit")
+        violation = handler(el, sample_pct, element_code, rule_lookup, val) if handler else None
+        if violation:
+            el.in_spec = 0
+            el.condition_violated = violation
+            out_of_spec_count += 1
     
     # Determine overall result
     if pending_count == len(elements):
@@ -596,98 +814,164 @@ def evaluate_sample_qc(sample_doc, batch_doc=None):
     }
 
 
-@frappe.whitelist()
-def update_sample_readings(sample_name, readings):
+# Element result fields written after a reading update + evaluation
+ELEMENT_RESULT_UPDATE_FIELDS = ("sample_pct", "deviation_pct", "in_spec", "condition_violated")
+
+
+def _bulk_update_element_results(elements, modified):
     """
-    Update sample element readings and re-evaluate QC.
-    
-    This is the main API called from QC Kiosk when lab enters values.
-    
-    Args:
-        sample_name: Name of the Melting Batch Spectro Sample child row
-        readings: dict of {element_code_or_name: sample_pct}
-        
-    Returns:
-        dict with updated sample and element info
+    Write ELEMENT_RESULT_UPDATE_FIELDS of all element rows in one
+    UPDATE ... SET field = CASE name WHEN ... END statement instead of one
+    UPDATE per row.
+    """
+    elements = [el for el in elements if el.name]
+    if not elements:
+        return
+    
+    values = {"names": tuple(el.name for el in elements), "modified": modified}
+    for i, el in enumerate(elements):
+        values[f"name_{i}"] = el.name
+        for field in ELEMENT_RESULT_UPDATE_FIELDS:
+            values[f"{field}_{i}"] = el.get(field)
+    
+    # Only the field names are formatted in; every value is a query parameter
+    set_clauses = []
+    for field in ELEMENT_RESULT_UPDATE_FIELDS:
+        whens = " ".join(f"WHEN %(name_{i})s THEN %({field}_{i})s" for i in range(len(elements)))
+        set_clauses.append(f"`{field}` = CASE name {whens} END")
+    
+    frappe.db.sql(f"""
+        UPDATE `tabMelting Sample Element Result`
+        SET {", ".join(set_clauses)}, modified = %(modified)s
+        WHERE name IN %(names)s
+    """, values)
+
+
+def _get_draft_sample_parent(sample_name):
+    """
+    Parent Melting Batch of a spectro sample, checked for write permission
+    and still in draft, as a batch save would check it.
     """
-    import json
-    
-    if isinstance(readings, str):
-        readings = json.loads(readings)
-    
     if not sample_name:
         frappe.throw(_("Sample name is required."))
     
-    # Find the sample row and its parent batch
-    sample_row = frappe.db.get_value(
+    parent = frappe.db.get_value(
         "Melting Batch Spectro Sample",
-        sample_name,
-        ["name", "parent", "parenttype"],
-        as_dict=True
+        {"name": sample_name, "parenttype": "Melting Batch"},
+        "parent"
     )
+    if not parent:
+        frappe.throw(_("Sample not found."))
     
-    if not sample_row:
-        frappe.throw(_("Sample not found: {0}").format(sample_name))
-    
-    batch = frappe.get_doc("Melting Batch", sample_row.parent)
+    frappe.has_permission("Melting Batch", "write", parent, throw=True)
+    if frappe.db.get_value("Melting Batch", parent, "docstatus") != 0:
+        frappe.throw(_("Cannot update samples of Melting Batch {0} after it is submitted or cancelled").format(parent))
     
-    # Find the sample in the batch
-    sample_doc = None
-    sample_idx = None
-    for idx, s in enumerate(batch.spectro_samples):
-        if s.name == sample_name:
-            sample_doc = s
-            sample_idx = idx
-            break
-    
-    if not sample_doc:
-        frappe.throw(_("Sample not found in batch."))
+    return parent
+
+
+# Legacy per-element percentage fields of a spectro sample
+LEGACY_ELEMENT_FIELDS = {
+    "Si": "si_percent", "Fe": "fe_percent", "Cu": "cu_percent",
+    "Mn": "mn_percent", "Mg": "mg_percent", "Zn": "zn_percent",
+    "Ti": "ti_percent", "Al": "al_percent"
+}
+
+
+def _apply_readings(sample_doc, readings):
+    """
+    Set readings on a spectro sample's element rows and legacy fields, and
+    move a Pending sample to In Lab. Returns the element code of each row.
+    """
+    # Key readings by element code once; a key that already is the code
+    # wins over a name that maps to the same code
+    norm_readings = {}
+    for key, value in (readings or {}).items():
+        code = get_element_code(key) or key
+        if key == code or code not in norm_readings:
+            norm_readings[code] = value
     
     # Update readings in element rows
-    readings = frappe._dict(readings or {})
-    
-    for el in sample_doc.elements:
-        element_name = el.element
-        element_code = get_element_code(element_name) if element_name else None
-        
-        # Check if reading provided for this element
-        value = None
-        if element_code and element_code in readings:
-            value = readings[element_code]
-        elif element_name and element_name in readings:
-            value = readings[element_name]
+    element_codes = []
+    for el in sample_doc.get("elements") or []:
+        element_code = get_element_code(el.element)
+        element_codes.append(element_code)
         
+        value = norm_readings.get(element_code) if element_code else None
         if value is not None:
             el.sample_pct = flt(value, 4)
     
     # Also update legacy element fields if present
-    legacy_map = {
-        "Si": "si_percent", "Fe": "fe_percent", "Cu": "cu_percent",
-        "Mn": "mn_percent", "Mg": "mg_percent", "Zn": "zn_percent",
-        "Ti": "ti_percent", "Al": "al_percent"
-    }
-    
-    for code, field in legacy_map.items():
-        if code in readings and hasattr(sample_doc, field):
-            setattr(sample_doc, field, flt(readings[code], 4))
+    for code, field in LEGACY_ELEMENT_FIELDS.items():
+        if code in norm_readings and hasattr(sample_doc, field):
+            setattr(sample_doc, field, flt(norm_readings[code], 4))
     
     # Update status to In Lab if was Pending
     if sample_doc.status == "Pending":
         sample_doc.status = "In Lab"
     
-    # Evaluate QC
-    eval_result = evaluate_sample_qc(sample_doc, batch)
+    return element_codes
+
+
+@frappe.whitelist()
+def update_sample_readings(sample_name, readings, include_elements=1):
+    """
+    Update sample element readings and re-evaluate QC.
     
-    batch.save()
-    frappe.db.commit()
+    This is the main API called from QC Kiosk when lab enters values.
+    
+    Args:
+        sample_name: Name of the Melting Batch Spectro Sample child row
+        readings: dict of {element_code_or_name: sample_pct}
+        include_elements: Pass 0 to leave the per-element list out of the
+            response when only the sample status is needed
+        
+    Returns:
+        dict with updated sample and element info
+    """
+    import json
+    
+    if isinstance(readings, str):
+        readings = json.loads(readings)
+    
+    # Checked as a batch save would: write permission and a draft batch
+    parent = _get_draft_sample_parent(sample_name)
+    
+    # Load only the sample row and its element rows, not the whole batch
+    sample_doc = frappe.get_doc("Melting Batch Spectro Sample", sample_name)
+    
+    element_codes = _apply_readings(sample_doc, readings)
+    
+    # Evaluate QC
+    eval_result = evaluate_sample_qc(sample_doc)
+    
+    # Write back the sample and element rows only, touching the batch's
+    # modified timestamp as a batch save would
+    now = now_datetime()
+    sample_doc.modified = now
+    sample_doc.db_update()
+    _bulk_update_element_results(sample_doc.elements, now)
+    frappe.db.set_value("Melting Batch", parent, "modified", now)
+    clear_qc_sample_list_cache()
+    
+    response = {
+        "sample_name": sample_doc.name,
+        "sample_id": sample_doc.sample_id,
+        "status": sample_doc.status,
+        "overall_result": sample_doc.overall_result,
+        "correction_required": sample_doc.correction_required,
+        "evaluation": eval_result
+    }
+    if not cint(include_elements):
+        return response
     
     # Build response with element details
     element_results = []
-    for el in sample_doc.elements:
+    for el, element_code in zip(sample_doc.elements, element_codes, strict=True):
         element_results.append({
             "name": el.name,
             "element": el.element,
-            "element_code": get_element_code(el.element),
+            "element_code": element_code,
             "condition_type": el.condition_type,
             "spec_min_pct": el.spec_min_pct,
             "spec_max_pct": el.spec_max_pct,
@@ -698,15 +982,8 @@ def update_sample_readings(sample_name, readings):
             "condition_violated": el.condition_violated
         })
     
-    return {
-        "sample_name": sample_doc.name,
-        "sample_id": sample_doc.sample_id,
-        "status": sample_doc.status,
-        "overall_result": sample_doc.overall_result,
-        "correction_required": sample_doc.correction_required,
-        "elements": element_results,
-        "evaluation": eval_result
-    }
+    response["elements"] = element_results
+    return response
 
 
 # ==================== QC KIOSK SAMPLE MANAGEMENT ====================
@@ -730,32 +1007,15 @@ def get_samples_for_qc(date=None, furnace=None, alloy=None, status_filter="pendi
     else:
         date = getdate(date)
     
+    cache_key = f"{QC_SAMPLE_LIST_CACHE_PREFIX}:{date}:{furnace or ''}:{alloy or ''}:{status_filter}"
+    result = frappe.cache().get_value(cache_key)
+    if result is not None:
+        return result
+    
     # Build date range
     start_of_day = f"{date} 00:00:00"
     end_of_day = f"{date} 23:59:59"
     
-    # Build filters for batch
-    batch_filters = {
-        "docstatus": ["<", 2]  # Not cancelled
-    }
-    if furnace:
-        batch_filters["furnace"] = furnace
-    if alloy:
-        batch_filters["alloy"] = alloy
-    
-    # Get batches matching filters
-    batches = frappe.get_all(
-        "Melting Batch",
-        filters=batch_filters,
-        fields=["name", "melting_batch_id", "furnace", "alloy", "product_item", "temper", "status", "qc_status"]
-    )
-    
-    batch_names = [b.name for b in batches]
-    batch_map = {b.name: b for b in batches}
-    
-    if not batch_names:
-        return []
-    
     # Build status filter for samples
     status_values = []
     if status_filter == "pending":
@@ -766,52 +1026,42 @@ def get_samples_for_qc(date=None, furnace=None, alloy=None, status_filter="pendi
         status_values = ["Correction Required"]
     # "all" - no status filter
     
-    # Get samples from these batches
-    sample_filters = {
-        "parent": ["in", batch_names],
-        "parenttype": "Melting Batch"
-    }
-    
-    # Add date filter
-    sample_filters["sample_time"] = ["between", [start_of_day, end_of_day]]
-    
+    # Samples of the day joined to their (not cancelled) batch in one query
+    conditions = [
+        "s.parenttype = 'Melting Batch'",
+        "s.sample_time BETWEEN %(start)s AND %(end)s",
+        "b.docstatus < 2",
+    ]
+    values = {"start": start_of_day, "end": end_of_day}
     if status_values:
-        sample_filters["status"] = ["in", status_values]
-    
-    samples = frappe.get_all(
-        "Melting Batch Spectro Sample",
-        filters=sample_filters,
-        fields=[
-            "name", "parent", "sample_id", "sample_time", "status",
-            "overall_result", "spec_master", "correction_required", "remarks"
-        ],
-        order_by="sample_time desc"
-    )
-    
-    # Enrich with batch info
-    result = []
-    for s in samples:
-        batch = batch_map.get(s.parent)
-        if batch:
-            result.append({
-                "name": s.name,
-                "sample_id": s.sample_id,
-                "sample_time": str(s.sample_time) if s.sample_time else None,
-                "status": s.status,
-                "overall_result": s.overall_result,
-                "spec_master": s.spec_master,
-                "correction_required": s.correction_required,
-                "remarks": s.remarks,
-                "batch_name": batch.name,
-                "batch_id": batch.melting_batch_id,
-                "furnace": batch.furnace,
-                "alloy": batch.alloy,
-                "product_item": batch.product_item,
-                "temper": batch.temper,
-                "batch_status": batch.status,
-                "batch_qc_status": batch.qc_status
-            })
-    
+        conditions.append("s.status IN %(statuses)s")
+        values["statuses"] = tuple(status_values)
+    if furnace:
+        conditions.append("b.furnace = %(furnace)s")
+        values["furnace"] = furnace
+    if alloy:
+        conditions.append("b.alloy = %(alloy)s")
+        values["alloy"] = alloy
+    
+    result = frappe.db.sql(f"""
+        SELECT
+            s.name, s.sample_id, s.sample_time, s.status, s.overall_result,
+            s.spec_master, s.correction_required, s.remarks,
+            b.name AS batch_name,
+            b.melting_batch_id AS batch_id,
+            b.furnace, b.alloy, b.product_item, b.temper,
+            b.status AS batch_status,
+            b.qc_status AS batch_qc_status
+        FROM `tabMelting Batch Spectro Sample` s
+        INNER JOIN `tabMelting Batch` b ON b.name = s.parent
+        WHERE {" AND ".join(conditions)}
+        ORDER BY s.sample_time DESC
+    """, values, as_dict=True)
+    
+    for row in result:
+        row.sample_time = str(row.sample_time) if row.sample_time else None
+    
+    frappe.cache().set_value(cache_key, result, expires_in_sec=QC_SAMPLE_LIST_CACHE_TTL)
     return result
 
 
@@ -874,10 +1124,10 @@ def get_sample_detail(sample_name):
             "note": el.note
         })
     
-    # Get ACCM info if available
+    # ACCM info for the master this sample is checked against
     accm_info = None
     if sample_doc.spec_master:
-        accm_info = get_composition_master_for_alloy(batch.alloy)
+        accm_info = get_composition_master_info(sample_doc.spec_master)
     
     return {
         "sample": {
@@ -908,6 +1158,39 @@ def get_sample_detail(sample_name):
     }
 
 
+# Sample fields a QC sign-off changes
+QC_SIGN_OFF_SAMPLE_FIELDS = (
+    "status", "lab_technician", "overall_result", "result_status",
+    "correction_required", "correction_note"
+)
+
+
+def _save_qc_sign_off(parent, sample_doc, batch_values, log=None):
+    """
+    Save a QC sign-off on the parent Melting Batch.
+
+    Sign-offs are infrequent and audited, so the batch is saved rather than
+    updated in place: the change gets a Version row, the modified check and
+    the batch's on_update hooks (casting plan sync, kiosk caches).
+    """
+    batch = frappe.get_doc("Melting Batch", parent)
+    
+    sample_rows = batch.get("spectro_samples", {"name": sample_doc.name})
+    if not sample_rows:
+        frappe.throw(_("Sample not found."))
+    
+    sample_rows[0].update({
+        field: sample_doc.get(field)
+        for field in QC_SIGN_OFF_SAMPLE_FIELDS
+        if sample_doc.get(field) is not None
+    })
+    batch.update(batch_values)
+    if log:
+        batch.append("process_logs", log)
+    
+    batch.save()
+
+
 @frappe.whitelist()
 def mark_sample_accepted(sample_name):
     """
@@ -920,44 +1203,30 @@ def mark_sample_accepted(sample_name):
     Returns:
         dict with updated status
     """
-    if not sample_name:
-        frappe.throw(_("Sample name is required."))
+    parent = _get_draft_sample_parent(sample_name)
     
-    # Find sample
-    sample_row = frappe.db.get_value(
-        "Melting Batch Spectro Sample",
-        sample_name,
-        ["name", "parent"],
-        as_dict=True
-    )
+    # Load only the sample row and its element rows, not the whole batch
+    sample_doc = frappe.get_doc("Melting Batch Spectro Sample", sample_name)
     
-    if not sample_row:
-        frappe.throw(_("Sample not found."))
+    # Re-evaluate to ensure it's actually in spec
+    eval_result = evaluate_sample_qc(sample_doc)
     
-    batch = frappe.get_doc("Melting Batch", sample_row.parent)
+    if sample_doc.overall_result != "In Spec":
+        frappe.throw(_(
+            "Cannot accept sample - it is not In Spec. "
+            "Overall result: {0}, Out of spec count: {1}"
+        ).format(sample_doc.overall_result, eval_result.get("out_of_spec_count", 0)))
     
-    # Find and update sample
-    for s in batch.spectro_samples:
-        if s.name == sample_name:
-            # Re-evaluate to ensure it's actually in spec
-            eval_result = evaluate_sample_qc(s, batch)
-            
-            if s.overall_result != "In Spec":
-                frappe.throw(_(
-                    "Cannot accept sample - it is not In Spec. "
-                    "Overall result: {0}, Out of spec count: {1}"
-                ).format(s.overall_result, eval_result.get("out_of_spec_count", 0)))
-            
-            s.status = "Accepted"
-            s.lab_technician = frappe.session.user
-            break
-    
-    # Update batch QC status
-    batch.qc_status = "OK"
-    batch.lab_signed_by = frappe.session.user
+    sample_doc.status = "Accepted"
+    sample_doc.lab_technician = frappe.session.user
     
-    batch.save()
-    frappe.db.commit()
+    # Element rows are written in place (a batch save does not write them);
+    # the sign-off itself is saved on the batch
+    _bulk_update_element_results(sample_doc.elements, now_datetime())
+    _save_qc_sign_off(parent, sample_doc, {
+        "qc_status": "OK",
+        "lab_signed_by": frappe.session.user
+    })
     
     return {
         "sample_status": "Accepted",
@@ -979,46 +1248,24 @@ def mark_sample_correction_required(sample_name, correction_note):
     Returns:
         dict with updated status
     """
-    if not sample_name:
-        frappe.throw(_("Sample name is required."))
-    
     if not correction_note:
         frappe.throw(_("Correction note is required."))
     
-    # Find sample
-    sample_row = frappe.db.get_value(
-        "Melting Batch Spectro Sample",
-        sample_name,
-        ["name", "parent"],
-        as_dict=True
-    )
-    
-    if not sample_row:
-        frappe.throw(_("Sample not found."))
-    
-    batch = frappe.get_doc("Melting Batch", sample_row.parent)
-    
-    # Find and update sample
-    for s in batch.spectro_samples:
-        if s.name == sample_name:
-            s.status = "Correction Required"
-            s.overall_result = "Out of Spec"
-            s.correction_required = 1
-            s.correction_note = correction_note
-            s.lab_technician = frappe.session.user
-            break
+    parent = _get_draft_sample_parent(sample_name)
     
-    # Update batch QC status
-    batch.qc_status = "Correction Required"
-    
-    # Add process log entry
-    prow = batch.append("process_logs", {})
-    prow.log_time = now_datetime()
-    prow.event_type = "Correction"
-    prow.note = f"QC Correction Required: {correction_note}"
-    
-    batch.save()
-    frappe.db.commit()
+    sample_doc = frappe._dict(
+        name=sample_name,
+        status="Correction Required",
+        overall_result="Out of Spec",
+        correction_required=1,
+        correction_note=correction_note,
+        lab_technician=frappe.session.user
+    )
+    _save_qc_sign_off(parent, sample_doc, {"qc_status": "Correction Required"}, log={
+        "log_time": now_datetime(),
+        "event_type": "Correction",
+        "note": f"QC Correction Required: {correction_note}",
+    })
     
     return {
         "sample_status": "Correction Required",
@@ -1078,7 +1325,7 @@ def create_resample(sample_name):
 
 # ==================== SPECTROMETER INTEGRATION API ====================
 
-@frappe.whitelist(allow_guest=True)
+@frappe.whitelist()
 def ingest_spectro_payload(sample_name, payload):
     """
     API for direct spectrometer integration.
@@ -1089,6 +1336,10 @@ def ingest_spectro_payload(sample_name, payload):
     - LIMS systems pushing results
     - Manual import tools
     
+    Callers authenticate as an integration user with an API key
+    ("Authorization: token <api_key>:<api_secret>"); that user needs write
+    permission on Melting Batch.
+    
     Args:
         sample_name: Name of the spectro sample to update
         payload: dict of element readings, e.g.:
@@ -1115,26 +1366,13 @@ def ingest_spectro_payload(sample_name, payload):
         return {"success": False, "error": "payload is required"}
     
     try:
-        # Update readings using existing function
+        # Update readings using existing function (this also moves a
+        # Pending sample to In Lab)
         result = update_sample_readings(sample_name, payload)
         
-        # Find the sample and update status to In Lab
-        sample_row = frappe.db.get_value(
-            "Melting Batch Spectro Sample",
-            sample_name,
-            ["name", "parent"],
-            as_dict=True
-        )
-        
-        if sample_row:
-            batch = frappe.get_doc("Melting Batch", sample_row.parent)
-            for s in batch.spectro_samples:
-                if s.name == sample_name:
-                    if s.status == "Pending":
-                        s.status = "In Lab"
-                    break
-            batch.save()
-            frappe.db.commit()
+        # Integration boundary: the spectrometer may call in outside a
+        # regular request, so commit once here
+        frappe.db.commit()
         
         return {
             "success": True,
@@ -1178,7 +1416,15 @@ def check_qc_for_transfer(batch_name):
         }
     
     batch = frappe.get_doc("Melting Batch", batch_name)
+    return get_qc_transfer_status(batch)
+
+
+def get_qc_transfer_status(batch):
+    """
+    Evaluate QC transfer readiness for an already loaded Melting Batch.
     
+    Same result as check_qc_for_transfer, without reloading the batch.
+    """
     # Check for accepted samples
     accepted_samples = []
     pending_samples = []
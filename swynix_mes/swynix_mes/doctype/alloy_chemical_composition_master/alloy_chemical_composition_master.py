@@ -5,12 +5,40 @@ import frappe
 from frappe import _
 from frappe.model.document import Document
 
+from swynix_mes.swynix_mes.utils.composition_check import (
+	clear_active_composition_master_cache,
+)
+from swynix_mes.swynix_mes.utils.composition_check import (
+	get_active_composition_master as get_active_master,
+)
+
 
 class AlloyChemicalCompositionMaster(Document):
 	def validate(self):
 		self.validate_single_active_per_alloy()
 		self.validate_composition_rules()
 
+	def on_update(self):
+		"""Compile the QC kiosk's spectro element rows for this revision up front"""
+		from swynix_mes.swynix_mes.api.qc_kiosk import get_element_templates
+
+		self.clear_active_master_cache()
+		get_element_templates(self.name, self.modified)
+
+	def on_trash(self):
+		self.clear_active_master_cache()
+
+	def clear_active_master_cache(self):
+		"""
+		Drop the cached active master of this alloy and, if it changed, the old
+		alloy. It is dropped again after commit, since a concurrent read before
+		the commit can re-cache the old master.
+		"""
+		old_doc = self.get_doc_before_save()
+		alloys = (self.alloy, old_doc.alloy if old_doc else None)
+		clear_active_composition_master_cache(*alloys)
+		frappe.db.after_commit.add(lambda: clear_active_composition_master_cache(*alloys))
+
 	def validate_single_active_per_alloy(self):
 		"""Ensure only one active record per alloy"""
 		if self.is_active:
@@ -305,16 +333,7 @@ def get_active_composition_master(alloy):
 	Returns:
 		dict: Composition master document with rules, or None if not found
 	"""
-	master_name = frappe.db.get_value(
-		"Alloy Chemical Composition Master",
-		{"alloy": alloy, "is_active": 1},
-		"name"
-	)
-
-	if master_name:
-		return frappe.get_doc("Alloy Chemical Composition Master", master_name)
-
-	return None
+	return get_active_master(alloy, load_doc=True)
 
 
 @frappe.whitelist()
@@ -327,7 +346,8 @@ def get_composition_rules_for_alloy(alloy):
 	Returns:
 		list: List of composition rules with all necessary fields
 	"""
-	master = get_active_composition_master(alloy)
+	# Cached header and rules; no need to load the Document
+	master = get_active_master(alloy)
 	if not master:
 		return []
 
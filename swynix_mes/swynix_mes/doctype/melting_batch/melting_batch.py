@@ -10,10 +10,56 @@ from frappe.utils import flt, getdate, now_datetime, get_datetime
 ACTIVE_BATCH_STATUSES = [
 	"Charging", "Melting", "Fluxing", "Sampling", "Correction", "Ready for Transfer"
 ]
+# Precomputed forms for membership checks and SQL "IN %s" parameters
+_ACTIVE_BATCH_STATUSES_SET = frozenset(ACTIVE_BATCH_STATUSES)
+_ACTIVE_STATUSES_SQL = tuple(ACTIVE_BATCH_STATUSES)
 
 # Statuses that indicate processing has begun (block cancellation)
 PROCESSING_STARTED_STATUSES = ["Charging", "Melting", "Ready for Transfer", "Transferred", "Scrapped"]
 
+# Short-lived cache of the Melting Kiosk batch list per furnace and plan date
+FURNACE_BATCHES_CACHE_PREFIX = "swynix_mes:melting_batches_for_furnace"
+FURNACE_BATCHES_CACHE_TTL = 10  # seconds
+
+
+# Short-lived cache of the kiosk furnace availability check
+FURNACE_AVAILABILITY_CACHE_PREFIX = "swynix_mes:furnace_availability"
+FURNACE_AVAILABILITY_CACHE_TTL = 3  # seconds
+
+
+# Short-lived cache of the QC Kiosk sample lists; every batch write clears
+# it through MeltingBatch.clear_kiosk_cache, the TTL only bounds writes that
+# bypass the batch entirely
+QC_SAMPLE_LIST_CACHE_PREFIX = "swynix_mes:qc_kiosk_samples"
+QC_SAMPLE_LIST_CACHE_TTL = 15  # seconds
+
+
+def get_furnace_batches_cache_key(furnace, plan_date):
+	"""Cache key for the kiosk batch list of a furnace on a plan date"""
+	return f"{FURNACE_BATCHES_CACHE_PREFIX}:{furnace}:{getdate(plan_date)}"
+
+
+def clear_furnace_batches_cache(furnace, plan_date):
+	"""Drop the cached kiosk batch list of a furnace on a plan date"""
+	if furnace and plan_date:
+		frappe.cache().delete_value(get_furnace_batches_cache_key(furnace, plan_date))
+
+
+def get_furnace_availability_cache_key(furnace):
+	"""Cache key for the kiosk availability check of a furnace"""
+	return f"{FURNACE_AVAILABILITY_CACHE_PREFIX}:{furnace}"
+
+
+def clear_furnace_availability_cache(furnace):
+	"""Drop the cached kiosk availability check of a furnace"""
+	if furnace:
+		frappe.cache().delete_value(get_furnace_availability_cache_key(furnace))
+
+
+def clear_qc_sample_list_cache():
+	"""Drop every cached QC kiosk sample list"""
+	frappe.cache().delete_keys(QC_SAMPLE_LIST_CACHE_PREFIX)
+
 
 class MeltingBatch(Document):
 	def validate(self):
@@ -38,10 +84,7 @@ class MeltingBatch(Document):
 
 	def calculate_charged_weight(self):
 		"""Calculate total charged weight from raw materials table"""
-		total_kg = 0
-		for row in self.raw_materials or []:
-			total_kg += flt(row.qty_kg, 3)
-		
+		total_kg = sum(flt(row.qty_kg, 3) for row in self.raw_materials or [])
 		self.charged_weight_mt = flt(total_kg / 1000, 3)
 
 	def calculate_yield_percent(self):
@@ -168,7 +211,7 @@ class MeltingBatch(Document):
 			return
 
 		# Only check if this batch is going into an active status
-		if self.status not in ACTIVE_BATCH_STATUSES:
+		if self.status not in _ACTIVE_BATCH_STATUSES_SET:
 			return
 
 		# Check if any other batch for the same furnace is currently active
@@ -180,7 +223,7 @@ class MeltingBatch(Document):
 			AND status IN %s
 			AND docstatus < 2
 			LIMIT 1
-		""", (self.furnace, self.name or "", tuple(ACTIVE_BATCH_STATUSES)), as_dict=True)
+		""", (self.furnace, self.name or "", _ACTIVE_STATUSES_SQL), as_dict=True)
 
 		if existing_active:
 			frappe.throw(
@@ -196,6 +239,27 @@ class MeltingBatch(Document):
 	def on_update(self):
 		"""Actions after save - sync with Casting Plan"""
 		self.sync_to_casting_plan()
+		self.clear_kiosk_cache()
+
+	def on_update_after_submit(self):
+		self.clear_kiosk_cache()
+
+	def on_cancel(self):
+		self.clear_kiosk_cache()
+
+	def on_trash(self):
+		self.clear_kiosk_cache()
+
+	def clear_kiosk_cache(self):
+		"""Invalidate cached kiosk batch lists, availability and QC sample lists"""
+		clear_furnace_batches_cache(self.furnace, self.plan_date)
+		clear_furnace_availability_cache(self.furnace)
+		clear_qc_sample_list_cache()
+
+		old_doc = self.get_doc_before_save()
+		if old_doc and (old_doc.furnace != self.furnace or old_doc.plan_date != self.plan_date):
+			clear_furnace_batches_cache(old_doc.furnace, old_doc.plan_date)
+			clear_furnace_availability_cache(old_doc.furnace)
 
 	def sync_to_casting_plan(self):
 		"""
@@ -262,6 +326,68 @@ class MeltingBatch(Document):
 				message=f"Error syncing batch {self.name} to plan {self.ppc_casting_plan}: {str(e)}"
 			)
 
+	def insert_new_child_rows(self, **parent_updates):
+		"""
+		Insert child rows appended since load without re-saving the whole batch.
+
+		Used by kiosk endpoints that only add charge/log/sample rows: existing
+		children are not re-written and the batch is not re-validated. Any
+		parent field values passed are written together with the modified
+		timestamp.
+
+		Keeps the checks a save would make: write permission, mandatory
+		fields and links of the new rows, and that the batch has not been
+		changed since it was loaded.
+		"""
+		if self.docstatus != 0:
+			frappe.throw(_("Cannot add rows to Melting Batch {0} after it is submitted or cancelled").format(self.name))
+
+		self.check_permission("write")
+
+		new_rows = [row for row in self.get_all_children() if row.get("__islocal")]
+		for row in new_rows:
+			self.validate_new_child_row(row)
+
+		self.check_not_modified_since_load()
+
+		for row in new_rows:
+			row.db_insert()
+			row.__dict__.pop("__islocal", None)
+
+		self.db_set(parent_updates or {"modified": now_datetime()})
+		self.clear_kiosk_cache()
+
+	def validate_new_child_row(self, row):
+		"""Mandatory field and link checks a save runs on a child row"""
+		missing = row._get_missing_mandatory_fields()
+		if missing:
+			frappe.throw("<br>".join(msg for _fieldname, msg in missing), frappe.MandatoryError)
+
+		invalid_links, cancelled_links = row.get_invalid_links()
+		if invalid_links:
+			msg = ", ".join(link[2] for link in invalid_links)
+			frappe.throw(_("Could not find {0}").format(msg), frappe.LinkValidationError)
+		if cancelled_links:
+			msg = ", ".join(link[2] for link in cancelled_links)
+			frappe.throw(_("Cannot link cancelled document: {0}").format(msg), frappe.CancelledLinkError)
+
+	def check_not_modified_since_load(self):
+		"""
+		Lock the batch row and throw if it was saved by someone else after
+		this document was loaded, as save() does via check_if_latest.
+		"""
+		current = frappe.db.get_value(
+			"Melting Batch", self.name, ["modified", "docstatus"], as_dict=True, for_update=True
+		)
+		if not current:
+			frappe.throw(_("Melting Batch {0} not found").format(self.name), frappe.DoesNotExistError)
+
+		if current.docstatus != 0 or get_datetime(current.modified) != get_datetime(self.modified):
+			frappe.throw(
+				_("Melting Batch {0} has been modified after you opened it. Please refresh and try again.").format(self.name),
+				frappe.TimestampMismatchError
+			)
+
 	def mark_melting_started_if_first_time(self):
 		"""
 		Called when the first irreversible melting action happens
@@ -471,17 +597,24 @@ def get_charge_mix_for_alloy(doctype, txt, searchfield, start, page_len, filters
 @frappe.whitelist()
 def get_melting_batch_summary(melting_batch):
 	"""Get summary data for a Melting Batch"""
-	doc = frappe.get_doc("Melting Batch", melting_batch)
-	
-	return {
-		"melting_batch_id": doc.melting_batch_id,
-		"status": doc.status,
-		"alloy": doc.alloy,
-		"furnace": doc.furnace,
-		"planned_weight_mt": doc.planned_weight_mt,
-		"charged_weight_mt": doc.charged_weight_mt,
-		"tapped_weight_mt": doc.tapped_weight_mt,
-		"yield_percent": doc.yield_percent,
-		"raw_material_count": len(doc.raw_materials or []),
-		"spectro_sample_count": len(doc.spectro_samples or [])
-	}
+	# Header fields plus child row counts; the child tables are not loaded
+	summary = frappe.db.get_value(
+		"Melting Batch",
+		melting_batch,
+		[
+			"name", "melting_batch_id", "status", "alloy", "furnace",
+			"planned_weight_mt", "charged_weight_mt", "tapped_weight_mt", "yield_percent",
+		],
+		as_dict=True
+	)
+	if not summary:
+		frappe.throw(_("Melting Batch {0} not found").format(melting_batch), frappe.DoesNotExistError)
+
+	child_filters = {"parent": summary.pop("name"), "parenttype": "Melting Batch"}
+	summary.raw_material_count = frappe.db.count(
+		"Melting Batch Raw Material", dict(child_filters, parentfield="raw_materials")
+	)
+	summary.spectro_sample_count = frappe.db.count(
+		"Melting Batch Spectro Sample", dict(child_filters, parentfield="spectro_samples")
+	)
+	return summary
@@ -1,6 +1,8 @@
 # Copyright (c) 2025, Swynix and Contributors
 # See license.txt
 
+from unittest.mock import patch
+
 import frappe
 from frappe.tests.utils import FrappeTestCase
 
@@ -45,15 +47,46 @@ class TestMeltingBatch(FrappeTestCase):
 		with self.assertRaises(frappe.ValidationError):
 			doc.validate_datetime_sequence()
 
-
-
-
-
-
-
-
-
-
-
-
-
+	def _draft_batch(self):
+		"""Unsaved draft batch posing as a loaded one, for insert_new_child_rows"""
+		doc = frappe.new_doc("Melting Batch")
+		doc.name = "_Test Melting Batch"
+		doc.docstatus = 0
+		doc.modified = "2025-12-04 10:00:00"
+		return doc
+
+	def test_insert_new_child_rows_requires_write_permission(self):
+		"""Adding kiosk rows needs write permission on the batch"""
+		doc = self._draft_batch()
+		doc.append("process_logs", {"event_type": "Other"})
+
+		with patch.object(doc, "has_permission", return_value=False):
+			with self.assertRaises(frappe.PermissionError):
+				doc.insert_new_child_rows()
+
+	def test_insert_new_child_rows_validates_new_rows(self):
+		"""New rows get the mandatory and link checks a save would run"""
+		doc = self._draft_batch()
+		doc.append("raw_materials", {"item_code": "_Test Item That Does Not Exist", "qty_kg": 100})
+
+		with patch.object(doc, "has_permission", return_value=True):
+			with self.assertRaises(frappe.LinkValidationError):
+				doc.insert_new_child_rows()
+
+		doc = self._draft_batch()
+		doc.append("raw_materials", {})
+
+		with patch.object(doc, "has_permission", return_value=True):
+			with self.assertRaises(frappe.MandatoryError):
+				doc.insert_new_child_rows()
+
+	def test_insert_new_child_rows_rejects_stale_batch(self):
+		"""A batch saved elsewhere since it was loaded is not written over"""
+		doc = self._draft_batch()
+		doc.append("process_logs", {"event_type": "Other"})
+
+		current = frappe._dict(modified="2025-12-04 10:05:00", docstatus=0)
+		with patch.object(doc, "has_permission", return_value=True), \
+				patch.object(frappe.db, "get_value", return_value=current):
+			with self.assertRaises(frappe.TimestampMismatchError):
+				doc.insert_new_child_rows()
@@ -1,6 +1,7 @@
 # Copyright (c) 2025, Swynix and contributors
 # For license information, please see license.txt
 
+import frappe
 from frappe.model.document import Document
 
 
@@ -8,14 +9,10 @@ class MeltingBatchSpectroSample(Document):
 	pass
 
 
-
-
-
-
-
-
-
-
-
-
-
+def on_doctype_update():
+	"""Composite indexes for the QC kiosk sample lookups"""
+	# Day list: parenttype + sample_time range, status checked from the index
+	frappe.db.add_index("Melting Batch Spectro Sample", ["parenttype", "sample_time", "status"])
+	# Samples of one batch in time order
+	frappe.db.add_index("Melting Batch Spectro Sample", ["parent", "sample_time"])
+	frappe.db.add_index("Melting Batch Spectro Sample", ["spec_master"])
@@ -12,6 +12,12 @@ from frappe.model.document import Document
 SHIFTABLE_STATUSES = ["Planned", "Released"]
 # Plans that are locked (already in production or completed)
 LOCKED_STATUSES = ["Melting", "Metal Ready", "Casting", "Coils Complete", "Not Produced"]
+# Set forms for in-memory membership checks; the lists stay for ORM/SQL filters
+SHIFTABLE_STATUSES_SET = frozenset(SHIFTABLE_STATUSES)
+LOCKED_STATUSES_SET = frozenset(LOCKED_STATUSES)
+# Every status except Not Produced, as a positive IN list the
+# (caster, status, start_datetime) index can range-scan
+DISPLAY_STATUSES = SHIFTABLE_STATUSES + [s for s in LOCKED_STATUSES if s != "Not Produced"]
 
 
 class PPCCastingPlan(Document):
@@ -79,7 +85,7 @@ class PPCCastingPlan(Document):
 		from frappe.utils import get_datetime
 		
 		# Only update planned duration for plans that haven't started yet
-		if self.status not in SHIFTABLE_STATUSES:
+		if self.status not in SHIFTABLE_STATUSES_SET:
 			return
 		
 		if self.start_datetime and self.end_datetime:
@@ -204,6 +210,8 @@ class PPCCastingPlan(Document):
 		of the schedule. We move all plans with start_datetime >= this plan's
 		start_datetime forward by this plan's duration.
 		"""
+		from frappe.utils import now_datetime
+
 		if not self.caster or not self.start_datetime or not self.end_datetime:
 			return
 
@@ -212,43 +220,34 @@ class PPCCastingPlan(Document):
 		if duration.total_seconds() <= 0:
 			return
 
-		# Fetch all future plans for this caster that are shiftable
-		future_plans = frappe.get_all(
-			"PPC Casting Plan",
-			filters={
+		# Shift all future shiftable plans forward by the duration of the new
+		# plan in one UPDATE. Writing the columns directly skips overlap
+		# validation on each shifted document; ordering and gaps are preserved.
+		frappe.db.sql(
+			"""
+			UPDATE `tabPPC Casting Plan`
+			SET start_datetime = DATE_ADD(start_datetime, INTERVAL %(delta)s SECOND),
+				end_datetime = DATE_ADD(end_datetime, INTERVAL %(delta)s SECOND),
+				modified = %(modified)s,
+				modified_by = %(user)s
+			WHERE caster = %(caster)s
+				AND status IN %(statuses)s
+				AND docstatus < 2
+				AND start_datetime >= %(from_datetime)s
+				AND name != %(exclude_name)s
+			""",
+			{
+				"delta": int(duration.total_seconds()),
+				"modified": now_datetime(),
+				"user": frappe.session.user,
 				"caster": self.caster,
-				"status": ["in", SHIFTABLE_STATUSES],
-				"docstatus": ["<", 2],
-				"start_datetime": [">=", self.start_datetime],
+				"statuses": tuple(SHIFTABLE_STATUSES),
+				"from_datetime": self.start_datetime,
+				# Safety: skip self if somehow present
+				"exclude_name": self.name or "New",
 			},
-			fields=["name", "start_datetime", "end_datetime"],
-			order_by="start_datetime asc",
 		)
 
-		if not future_plans:
-			return
-
-		# Shift each plan forward by the duration of the new plan.
-		# We update via db.set_value to avoid triggering overlap validation
-		# on each shifted document; overall ordering and gaps are preserved.
-		for p in future_plans:
-			# Safety: skip self if somehow present
-			if p.name == (self.name or "New"):
-				continue
-
-			new_start = p.start_datetime + duration
-			new_end = p.end_datetime + duration
-
-			frappe.db.set_value(
-				"PPC Casting Plan",
-				p.name,
-				{
-					"start_datetime": new_start,
-					"end_datetime": new_end,
-				},
-				update_modified=True,
-			)
-
 	def check_caster_overlap(self):
 		"""
 		Check for overlapping plans on the same caster.
@@ -261,31 +260,31 @@ class PPCCastingPlan(Document):
 		if not self.caster or not self.start_datetime or not self.end_datetime:
 			return
 
+		# Two plans overlap when each starts before the other ends. Written as
+		# plain range predicates so the (caster, status, start_datetime) index
+		# bounds the scan; plan durations are always positive.
+		params = {
+			"name": self.name or "New",
+			"caster": self.caster,
+			"start": self.start_datetime,
+			"end": self.end_datetime,
+		}
+
 		# 1) Always check for overlaps with LOCKED plans
 		locked_overlap = frappe.db.sql(
 			"""
 			SELECT name, status
 			FROM `tabPPC Casting Plan`
 			WHERE
-				name != %s
-				AND caster = %s
-				AND status IN %s
+				name != %(name)s
+				AND caster = %(caster)s
+				AND status IN %(statuses)s
 				AND docstatus < 2
-				AND (
-					(start_datetime <= %s AND end_datetime > %s) OR
-					(start_datetime < %s AND end_datetime >= %s) OR
-					(start_datetime >= %s AND end_datetime <= %s)
-				)
+				AND start_datetime < %(end)s
+				AND end_datetime > %(start)s
 			LIMIT 1
 			""",
-			(
-				self.name or "New",
-				self.caster,
-				tuple(LOCKED_STATUSES),
-				self.start_datetime, self.start_datetime,
-				self.end_datetime, self.end_datetime,
-				self.start_datetime, self.end_datetime,
-			),
+			dict(params, statuses=tuple(LOCKED_STATUSES)),
 			as_dict=True
 		)
 
@@ -305,27 +304,15 @@ class PPCCastingPlan(Document):
 			SELECT name
 			FROM `tabPPC Casting Plan`
 			WHERE
-				name != %s
-				AND caster = %s
-				AND status IN %s
+				name != %(name)s
+				AND caster = %(caster)s
+				AND status IN %(statuses)s
 				AND docstatus < 2
-				AND start_datetime < %s
-				AND (
-					(start_datetime <= %s AND end_datetime > %s) OR
-					(start_datetime < %s AND end_datetime >= %s) OR
-					(start_datetime >= %s AND end_datetime <= %s)
-				)
+				AND start_datetime < %(start)s
+				AND end_datetime > %(start)s
 			LIMIT 1
 			""",
-			(
-				self.name or "New",
-				self.caster,
-				tuple(SHIFTABLE_STATUSES),
-				self.start_datetime,  # Only plans that start BEFORE this plan
-				self.start_datetime, self.start_datetime,
-				self.end_datetime, self.end_datetime,
-				self.start_datetime, self.end_datetime,
-			),
+			dict(params, statuses=tuple(SHIFTABLE_STATUSES)),
 			as_dict=True
 		)
 
@@ -382,7 +369,7 @@ class PPCCastingPlan(Document):
 		- linked_melting_batch is empty OR the batch is still Draft with no materials
 		"""
 		# Check status - block if already in production
-		if self.status in LOCKED_STATUSES:
+		if self.status in LOCKED_STATUSES_SET:
 			frappe.throw(
 				_("Casting Plan cannot be cancelled because {0}.<br><br>"
 				  "If the heat was rejected, mark the Melting Batch as 'Scrapped' "
@@ -519,7 +506,7 @@ class PPCCastingPlan(Document):
 			self.actual_start = actual_start_time
 		
 		# Update status to Melting
-		if self.status in SHIFTABLE_STATUSES:
+		if self.status in SHIFTABLE_STATUSES_SET:
 			self.status = "Melting"
 		
 		self.save(ignore_permissions=True)
@@ -528,6 +515,16 @@ class PPCCastingPlan(Document):
 		shift_future_plans_after(self)
 
 
+def on_doctype_update():
+	"""Composite indexes for the kiosk date-range lookups"""
+	frappe.db.add_index("PPC Casting Plan", ["plan_type", "status", "start_datetime"])
+	frappe.db.add_index("PPC Casting Plan", ["plan_type", "caster", "start_datetime"])
+	frappe.db.add_index("PPC Casting Plan", ["plan_type", "furnace", "start_datetime"])
+	frappe.db.add_index("PPC Casting Plan", ["caster", "status", "start_datetime"])
+	# Calendar/export range reads filter caster + start_datetime
+	frappe.db.add_index("PPC Casting Plan", ["caster", "start_datetime"])
+
+
 @frappe.whitelist()
 def get_casting_plans_for_caster(caster, from_date=None, to_date=None):
 	"""Get all casting plans for a caster within a date range.
@@ -543,7 +540,7 @@ def get_casting_plans_for_caster(caster, from_date=None, to_date=None):
 	"""
 	filters = {
 		"caster": caster,
-		"status": ["not in", ["Not Produced"]],  # Show all except Not Produced
+		"status": ["in", DISPLAY_STATUSES],  # Show all except Not Produced
 		"docstatus": ["<", 2]
 	}
 
@@ -595,7 +592,7 @@ def get_available_slots(caster, date, min_duration_minutes=60):
 		filters={
 			"caster": caster,
 			"plan_date": date,
-			"status": ["not in", ["Not Produced"]],
+			"status": ["in", DISPLAY_STATUSES],
 			"docstatus": ["<", 2]
 		},
 		fields=["start_datetime", "end_datetime"],
@@ -742,8 +739,6 @@ def shift_future_plans_after(current_plan):
 		else:
 			# No overlap, but update last_end for subsequent plans
 			last_end = end
-	
-	frappe.db.commit()
 
 
 @frappe.whitelist()
@@ -800,7 +795,7 @@ def start_melting_for_plan(plan_name, melting_batch_name=None, melt_start=None):
 	plan.melting_start = melt_start_dt
 	
 	# 5) Update status
-	if plan.status in SHIFTABLE_STATUSES:
+	if plan.status in SHIFTABLE_STATUSES_SET:
 		plan.status = "Melting"
 	
 	plan.save(ignore_permissions=True)
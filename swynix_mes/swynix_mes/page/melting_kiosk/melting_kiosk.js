@@ -425,18 +425,24 @@ function load_batch_detail(name) {
 	frappe.call({
 		method: "swynix_mes.swynix_mes.api.melting_kiosk.get_batch_detail",
 		args: {
-			batch_name: name
+			batch_name: name,
+			v: 2
 		},
 		callback: function (r) {
 			var data = r.message || {};
-			var doc = data;  // backward compatibility - doc contains all batch fields
-			var batch = data.batch || doc;
+			var batch = data.batch || {};
+			// doc = flat view of batch fields plus child tables
+			var doc = Object.assign({}, batch, {
+				raw_materials: data.raw_materials || [],
+				process_logs: data.process_logs || [],
+				spectro_samples: data.spectro_samples || []
+			});
 			var plan = data.plan || {};
 			var recipe = data.recipe || {};
 			var recipe_items = data.recipe_items || [];
 
 			// Store for later use
-			mk_current_batch_detail = data;
+			mk_current_batch_detail = doc;
 			mk_current_recipe_items = recipe_items;
 
 			render_batch_header(doc, batch, plan, recipe);
@@ -805,6 +811,7 @@ function get_event_style(event_type) {
 
 // Global variable for spectro context
 var mk_spectro_context = null;
+var mk_spectro_context_batch = null;
 
 function render_spectro_table(doc) {
 	var $container = $("#mk_spectro_table");
@@ -831,12 +838,21 @@ async function load_spectro_context(batch_name) {
 	}
 
 	try {
+		// Send the version we already hold for this batch; the server then
+		// answers with just {unchanged: true} if nothing has changed
+		var client_version = (mk_spectro_context && mk_spectro_context_batch === batch_name)
+			? mk_spectro_context.version
+			: null;
+
 		const r = await frappe.call({
 			method: "swynix_mes.swynix_mes.api.melting_kiosk.get_spectro_context",
-			args: { melting_batch: batch_name }
+			args: { melting_batch: batch_name, client_version: client_version }
 		});
 
-		mk_spectro_context = r.message || { elements: [], samples: [], sum_rules: [] };
+		if (!(r.message && r.message.unchanged)) {
+			mk_spectro_context = r.message || { elements: [], samples: [], sum_rules: [] };
+			mk_spectro_context_batch = batch_name;
+		}
 		render_spectro_table_from_context(mk_spectro_context);
 	} catch (e) {
 		console.error("Error loading spectro context:", e);
@@ -287,7 +287,8 @@ function fetch_events(start, end) {
 		args: {
 			caster: current_caster,
 			start: start,
-			end: end
+			end: end,
+			view: "event"
 		}
 	}).then(r => {
 		const plans = r.message || [];
@@ -742,9 +743,39 @@ function export_plans(format) {
 	const start = view.currentStart.toISOString();
 	const end = view.currentEnd.toISOString();
 
-	// Build URL for direct download
-	const url = `/api/method/swynix_mes.swynix_mes.api.ppc_caster_kiosk.export_plans?caster=${encodeURIComponent(current_caster)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}&format=${encodeURIComponent(format)}`;
+	// Listen before asking: a short background job can publish before the
+	// call returns
+	frappe.realtime.off("ppc_plan_export_ready");
+	frappe.realtime.on("ppc_plan_export_ready", (data) => {
+		frappe.realtime.off("ppc_plan_export_ready");
+		if (data.error) {
+			frappe.msgprint(data.error);
+		} else {
+			window.open(data.file_url, '_blank');
+		}
+	});
 
-	// Open URL to trigger download
-	window.open(url, '_blank');
+	// The server decides whether the range is large enough for a background
+	// job and checks smaller ranges before they are downloaded directly
+	frappe.call({
+		method: "swynix_mes.swynix_mes.api.ppc_caster_kiosk.export_plans",
+		args: { caster: current_caster, start: start, end: end, format: format, enqueue_only: 1 },
+		error: () => frappe.realtime.off("ppc_plan_export_ready")
+	}).then((r) => {
+		if (r.message && r.message.queued) {
+			frappe.show_alert({
+				message: __("Export is being prepared, you will be notified when it is ready."),
+				indicator: "blue"
+			});
+			return;
+		}
+
+		frappe.realtime.off("ppc_plan_export_ready");
+
+		// Build URL for direct download
+		const url = `/api/method/swynix_mes.swynix_mes.api.ppc_caster_kiosk.export_plans?caster=${encodeURIComponent(current_caster)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}&format=${encodeURIComponent(format)}`;
+
+		// Open URL to trigger download
+		window.open(url, '_blank');
+	});
 }
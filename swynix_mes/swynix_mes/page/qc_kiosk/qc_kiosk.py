@@ -13,6 +13,7 @@ Provides whitelisted methods for:
 import frappe
 from frappe import _
 from frappe.utils import flt, now_datetime, getdate, get_datetime
+from swynix_mes.swynix_mes.utils.workstation_cache import get_workstations
 
 
 # Element field mapping in Melting Batch Spectro Sample
@@ -908,12 +909,7 @@ def get_alloys():
 @frappe.whitelist()
 def get_furnaces():
     """Get list of furnaces for filter dropdown."""
-    return frappe.get_all(
-        "Workstation",
-        filters={"workstation_type": "Foundry"},
-        fields=["name", "workstation_name"],
-        order_by="name asc"
-    )
+    return get_workstations("Foundry")
 
 
 @frappe.whitelist()
@@ -11,6 +11,8 @@ This module provides comprehensive evaluation of:
 - Remainder: Aluminium minimum % or remainder conditions
 """
 
+from functools import lru_cache
+
 import frappe
 from frappe import _
 from frappe.utils import flt
@@ -46,10 +48,14 @@ ELEMENT_SYMBOLS = {
 }
 
 
+@lru_cache(maxsize=1024)
 def get_element_code(item_name):
     """
     Extract element code from item name.
     E.g., "Si" from "Silicon", "Fe" from "Iron", etc.
+
+    Also used by the QC kiosk. Partial names are matched by substring, as
+    melting_kiosk.get_element_code_from_item does.
     """
     if not item_name:
         return None
@@ -72,39 +78,116 @@ def get_element_code(item_name):
     return item_name  # Return as-is if no match
 
 
-def get_active_composition_master(alloy):
+ACCM_HEADER_COLUMNS = {
+    "master_name": "name",
+    "master_alloy": "alloy",
+    "master_alloy_name": "alloy_name",
+    "master_standard_reference": "standard_reference",
+    "master_revision_no": "revision_no",
+    "master_revision_date": "revision_date",
+    "master_modified": "modified",
+}
+
+ACTIVE_ACCM_CACHE_PREFIX = "swynix_mes:active_accm"
+ACTIVE_ACCM_CACHE_TTL = 3600  # seconds; the master's on_update/on_trash clear it
+
+
+def get_active_composition_master_cache_key(alloy):
+    """Cache key for the active composition master of an alloy"""
+    return f"{ACTIVE_ACCM_CACHE_PREFIX}:{alloy}"
+
+
+def clear_active_composition_master_cache(*alloys):
+    """Drop the cached active composition master of the given alloys"""
+    for alloy in alloys:
+        if alloy:
+            frappe.cache().delete_value(get_active_composition_master_cache_key(alloy))
+
+
+def get_active_composition_master(alloy, load_doc=False):
     """
-    Returns the active Alloy Chemical Composition Master doc for a given alloy.
+    Returns the active Alloy Chemical Composition Master for a given alloy.
     
     Logic:
     - Filter by alloy and is_active = 1
     - If multiple, pick the one with latest revision_date (or highest revision_no)
     
+    The master header and its composition_rules are returned as a
+    frappe._dict (name, alloy, alloy_name, standard_reference, revision_no,
+    revision_date, modified, composition_rules), cached in redis per alloy.
+    Callers must not modify it. Pass load_doc=True when the full Document
+    is needed.
+    
     Args:
         alloy: Item name/code for the alloy
+        load_doc: Return the frappe.Document instead of the lightweight dict
         
     Returns:
-        frappe.Document or None
+        frappe._dict, frappe.Document or None
     """
     if not alloy:
         return None
     
-    # Find active composition masters for this alloy
-    masters = frappe.get_all(
-        "Alloy Chemical Composition Master",
-        filters={
-            "alloy": alloy,
-            "is_active": 1
-        },
-        fields=["name", "revision_no", "revision_date"],
-        order_by="revision_date desc, revision_no desc, creation desc",
-        limit=1
-    )
-    
-    if not masters:
+    cache_key = get_active_composition_master_cache_key(alloy)
+    accm = frappe.cache().get_value(cache_key)
+    if accm is None:
+        # An alloy without an active master is cached as {}
+        accm = _load_active_composition_master(alloy) or {}
+        frappe.cache().set_value(cache_key, accm, expires_in_sec=ACTIVE_ACCM_CACHE_TTL)
+    
+    if not accm:
         return None
     
-    return frappe.get_doc("Alloy Chemical Composition Master", masters[0].name)
+    if load_doc:
+        return frappe.get_doc("Alloy Chemical Composition Master", accm.name)
+    
+    return accm
+
+
+def _load_active_composition_master(alloy):
+    """
+    Active master header and its composition_rules, read in one query, as
+    returned by get_active_composition_master. None if the alloy has none.
+    """
+    rows = frappe.db.sql("""
+        SELECT
+            m.name AS master_name,
+            m.alloy AS master_alloy,
+            m.alloy_name AS master_alloy_name,
+            m.standard_reference AS master_standard_reference,
+            m.revision_no AS master_revision_no,
+            m.revision_date AS master_revision_date,
+            m.modified AS master_modified,
+            r.*
+        FROM (
+            SELECT name, alloy, alloy_name, standard_reference,
+                revision_no, revision_date, modified
+            FROM `tabAlloy Chemical Composition Master`
+            WHERE alloy = %(alloy)s AND is_active = 1
+            ORDER BY revision_date DESC, revision_no DESC, creation DESC
+            LIMIT 1
+        ) m
+        LEFT JOIN `tabAlloy Chemical Rule Detail` r
+            ON r.parent = m.name
+            AND r.parenttype = 'Alloy Chemical Composition Master'
+            AND r.parentfield = 'composition_rules'
+        ORDER BY r.idx ASC
+    """, {"alloy": alloy}, as_dict=True)
+    
+    if not rows:
+        return None
+    
+    accm = frappe._dict({field: rows[0][column] for column, field in ACCM_HEADER_COLUMNS.items()})
+    accm.composition_rules = []
+    for row in rows:
+        # LEFT JOIN row of a master without rules
+        if row.name is None:
+            continue
+        for column in ACCM_HEADER_COLUMNS:
+            row.pop(column, None)
+        accm.composition_rules.append(row)
+    
+    return accm
 
 
 def evaluate_sample_against_alloy(alloy_name, sample_elements):
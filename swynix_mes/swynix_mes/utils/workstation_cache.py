@@ -0,0 +1,57 @@
+# Copyright (c) 2025, Swynix and contributors
+# For license information, please see license.txt
+
+"""
+Cached Workstation lists for kiosk dropdowns.
+
+Kiosks load the furnace/caster list on every page open, while the
+Workstation master almost never changes. Lists are kept in redis per
+workstation_type and dropped by the Workstation doc_events in hooks.py.
+The list is shared by all users and, like frappe.get_all, is not filtered
+by user permissions.
+"""
+
+import frappe
+
+WORKSTATION_LIST_CACHE_PREFIX = "swynix_mes:workstation_list"
+WORKSTATION_LIST_CACHE_TTL = 3600  # seconds; doc_events clear it on change
+
+
+def get_workstation_list_cache_key(workstation_type):
+    """Cache key for the Workstation list of a workstation_type"""
+    return f"{WORKSTATION_LIST_CACHE_PREFIX}:{workstation_type}"
+
+
+def get_workstations(workstation_type, sort_field="name"):
+    """
+    Return [{name, workstation_name}] for a workstation_type.
+
+    The cached list is ordered by name; pass sort_field="workstation_name"
+    to order by the display name instead.
+    """
+    cache_key = get_workstation_list_cache_key(workstation_type)
+    workstations = frappe.cache().get_value(cache_key)
+    if workstations is None:
+        workstations = frappe.get_all(
+            "Workstation",
+            filters={"workstation_type": workstation_type},
+            fields=["name", "workstation_name"],
+            order_by="name asc"
+        )
+        frappe.cache().set_value(cache_key, workstations, expires_in_sec=WORKSTATION_LIST_CACHE_TTL)
+
+    if sort_field != "name":
+        workstations = sorted(workstations, key=lambda w: w.get(sort_field) or "")
+    return workstations
+
+
+def clear_workstation_cache(doc, method=None, *args):
+    """doc_events hook: drop cached lists for the old and new workstation_type"""
+    types = {doc.get("workstation_type")}
+    before = doc.get_doc_before_save()
+    if before:
+        types.add(before.get("workstation_type"))
+
+    for workstation_type in types:
+        if workstation_type:
+            frappe.cache().delete_value(get_workstation_list_cache_key(workstation_type))